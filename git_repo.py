@@ -2,10 +2,44 @@ import os
 import io
 import sys
 import subprocess
+import threading
 from pathlib import Path
 import concurrent.futures
 from inspect import isgenerator
 
+### cat_file_batch keeps a 'git cat-file --batch' process running,
+# to read objects from the repository without starting a new Git process for each object
+class cat_file_batch:
+	def __init__(self, repo_path):
+		self.process = subprocess.Popen(["git", "cat-file", "--batch"],
+					stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=repo_path)
+		# Length of binary object ID, depends on the repository hash algorithm
+		self.oid_length = None
+		return
+
+	### read() returns a tuple of (object type, object data)
+	# obj can be an object SHA1 or any other object name, like <tree-ish>^{tree}
+	def read(self, obj):
+		self.process.stdin.write(obj.encode() + b'\n')
+		self.process.stdin.flush()
+
+		# The header is "<sha1> <type> <size>", or "<object> missing"
+		header = self.process.stdout.readline().decode().split()
+		if len(header) != 3:
+			raise subprocess.CalledProcessError(128, "git cat-file --batch " + obj)
+
+		self.oid_length = len(header[0]) // 2
+		data = self.process.stdout.read(int(header[2]))
+		# The object data is followed by a newline
+		self.process.stdout.read(1)
+		return header[1], data
+
+	def close(self):
+		self.process.stdin.close()
+		self.process.wait()
+		self.process.stdout.close()
+		return
+
 ### GIT: controls the aspects of conversion of SVN revision to Git repo(s)
 class GIT:
 	TOTAL_GIT_HASHED_FILES = 0
@@ -18,11 +52,32 @@ class GIT:
 		self.pending_ref_delete = []
 		self.pending_ref_updates = []
 		self.futures_executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(32, os.cpu_count()+4))
+		# Recently listed trees, by tree SHA1. Shared by all threads, guarded by tree_names_lock
+		self.tree_names_cache = {}
+		self.tree_names_lock = threading.Lock()
+		# Each thread gets its own cat-file process
+		self.cat_file_local = threading.local()
+		self.cat_file_list = []
+		self.cat_file_lock = threading.Lock()
 
 		return
 
 	def shutdown(self):
-		return self.futures_executor.shutdown()
+		self.futures_executor.shutdown()
+		for cat_file in self.cat_file_list:
+			cat_file.close()
+		self.cat_file_list = []
+		self.cat_file_local = threading.local()
+		return
+
+	def get_cat_file(self):
+		cat_file = getattr(self.cat_file_local, 'cat_file', None)
+		if cat_file is None:
+			cat_file = cat_file_batch(self.repo_path)
+			self.cat_file_local.cat_file = cat_file
+			with self.cat_file_lock:
+				self.cat_file_list.append(cat_file)
+		return cat_file
 
 	def get_cwd(self, env={}):
 		if not env:
@@ -216,6 +271,47 @@ class GIT:
 			raise subprocess.CalledProcessError(p.returncode, "git ls-tree")
 		return result.decode().splitlines()
 
+	### ls_tree_names returns the list of all file pathnames of a tree, same as 'ls-tree -r --name-only'.
+	# The tree objects are read through the cat-file process, instead of running 'git ls-tree'.
+	# Git trees are immutable, thus the lists are cached by the tree SHA1
+	TREE_NAMES_CACHE_SIZE = 16
+	def ls_tree_names(self, tree):
+		with self.tree_names_lock:
+			names = self.tree_names_cache.get(tree)
+		if names is not None:
+			return names
+
+		# The tree is read without holding the lock
+		names = []
+		self.read_tree_names(self.get_cat_file(), tree + '^{tree}', '', names)
+		with self.tree_names_lock:
+			if tree not in self.tree_names_cache \
+					and len(self.tree_names_cache) >= GIT.TREE_NAMES_CACHE_SIZE:
+				# Drop the oldest list
+				del self.tree_names_cache[next(iter(self.tree_names_cache))]
+			self.tree_names_cache[tree] = names
+		return names
+
+	def read_tree_names(self, cat_file, tree, prefix, names):
+		obj_type, data = cat_file.read(tree)
+		if obj_type != 'tree':
+			raise subprocess.CalledProcessError(128, "git cat-file --batch " + tree)
+
+		# The tree entries are "<mode> <name>\0<binary object ID>"
+		oid_length = cat_file.oid_length
+		pos = 0
+		while pos < len(data):
+			space = data.index(b' ', pos)
+			nul = data.index(b'\0', space)
+			end = nul + 1 + oid_length
+			name = prefix + data[space+1:nul].decode()
+			if data[pos:space] == b'40000':
+				self.read_tree_names(cat_file, data[nul+1:end].hex(), name + '/', names)
+			else:
+				names.append(name)
+			pos = end
+		return
+
 	def tag(self, tagname, sha1, message : list, tagger, email, date, *options, env=None):
 		if not env:
 			env = {}
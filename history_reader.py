@@ -23,6 +23,7 @@ import os
 import io
 import re
 import hashlib
+import functools
 
 def apply_delta_to_properties(props, delta):
 	if props is None:
@@ -492,7 +493,8 @@ class svn_tree(svn_object):
 	# unless expand_dir_contents is True, in which case all contents of the unmatched directory
 	# is also reported in the result
 	# Same path but different types are reported as first erase then add
-	def compare(tree1, tree2, path_prefix : str="", expand_dir_contents = True, item1=None,item2=None):
+	# prune_dirs is a tuple of directory paths (with trailing slash) to skip with all their contents
+	def compare(tree1, tree2, path_prefix : str="", expand_dir_contents = True, item1=None,item2=None, prune_dirs=()):
 		if (tree1 is not None and not tree1.is_finalized()) or (tree2 is not None and not tree2.is_finalized()):
 			raise Exception_history_parse("Non-finalized trees passed to compare_trees function")
 
@@ -538,8 +540,11 @@ class svn_tree(svn_object):
 				path = path_prefix + item2.name
 				if obj2.is_dir():
 					path += '/'
+					if prune_dirs and path.startswith(prune_dirs):
+						item2 = None
+						continue
 					if expand_dir_contents:
-						yield from type(obj2).compare(None, obj2, path, True, None, item2)
+						yield from type(obj2).compare(None, obj2, path, True, None, item2, prune_dirs)
 						item2 = None
 						continue
 				yield (path, None, obj2, None, item2)
@@ -552,8 +557,11 @@ class svn_tree(svn_object):
 				path = path_prefix + item1.name
 				if obj1.is_dir():
 					path += '/'
+					if prune_dirs and path.startswith(prune_dirs):
+						item1 = None
+						continue
 					if expand_dir_contents:
-						yield from type(obj1).compare(obj1, None, path, True, item1, None)
+						yield from type(obj1).compare(obj1, None, path, True, item1, None, prune_dirs)
 						item1 = None
 						continue
 				yield (path, obj1, None, item1, None)
@@ -566,7 +574,9 @@ class svn_tree(svn_object):
 			elif obj1.is_file():
 				yield (path_prefix + item1.name, obj1, obj2, item1, item2)
 			else:
-				yield from type(obj1).compare(obj1, obj2, path_prefix + item1.name + '/', expand_dir_contents, item1, item2)
+				path = path_prefix + item1.name + '/'
+				if not (prune_dirs and path.startswith(prune_dirs)):
+					yield from type(obj1).compare(obj1, obj2, path, expand_dir_contents, item1, item2, prune_dirs)
 
 			item1 = None
 			item2 = None
@@ -586,6 +596,22 @@ class svn_tree(svn_object):
 		if not ((tree1 is None or tree1.is_finalized()) and (tree2 is None or tree2.is_finalized())):
 			return svn_tree.diffs_metrics(-1, -1, -1, -1)
 
+		return cached_difference_metrics(difference_metrics_key(tree1, tree2))
+
+	### is_similar() returns True if the trees have more files in common (identical or different)
+	# than added and deleted files. The number of common files can't exceed the smaller tree's file count,
+	# thus if one tree has at least twice as many files as the other, the trees are not compared
+	def is_similar(tree1, tree2):
+		files1 = svn_tree.get_difference_metrics(tree1, None).deleted
+		files2 = svn_tree.get_difference_metrics(tree2, None).deleted
+		if files1 >= 0 and files2 >= 0 \
+				and min(files1, files2) * 3 <= files1 + files2:
+			return False
+
+		metrics = svn_tree.get_difference_metrics(tree1, tree2)
+		return metrics.added + metrics.deleted < metrics.identical + metrics.different
+
+	def make_difference_metrics(tree1, tree2):
 		identical_files = 0
 		different_files = 0
 		deleted_files = 0
@@ -660,6 +686,36 @@ class svn_tree(svn_object):
 
 		return svn_tree.diffs_metrics(identical_files, different_files, deleted_files, added_files)
 
+### difference_metrics_key hashes and compares by SVN SHA1 of the two trees.
+# The trees are carried along to calculate the metrics on a cache miss
+class difference_metrics_key:
+	__slots__ = ('tree1', 'tree2', 'sha1s')
+
+	def __init__(self, tree1, tree2):
+		self.tree1 = tree1
+		self.tree2 = tree2
+		self.sha1s = (tree1.svn_sha1 if tree1 is not None else None,
+				tree2.svn_sha1 if tree2 is not None else None)
+		return
+
+	def __hash__(self):
+		return hash(self.sha1s)
+
+	def __eq__(self, other):
+		return self.sha1s == other.sha1s
+
+### Finalized trees never change, and their difference metrics are cached by their SVN SHA1
+@functools.lru_cache(maxsize=0x10000)
+def cached_difference_metrics(key):
+	tree1 = key.tree1
+	tree2 = key.tree2
+	if tree1 is not None and tree1 is tree2:
+		# Finalized trees with same hash are the same object. All their files are identical
+		metrics = svn_tree.get_difference_metrics(tree1, None)
+		return svn_tree.diffs_metrics(metrics.deleted, 0, 0, 0)
+
+	return svn_tree.make_difference_metrics(tree1, tree2)
+
 ### The function pretty-prints the list returned by svn_tree.compare() function
 def print_diff(diff_list, fd):
 	if len(diff_list) == 0:
@@ -683,6 +739,8 @@ class history_revision:
 		self.log = dump_revision.log
 		self.author = dump_revision.author
 		self.datetime = dump_revision.datetime
+		# The date string is made once, for all branches changed in this revision
+		self.date_str = str(self.datetime)
 		self.tree = None
 		self.rev = dump_revision.rev
 		self.prev_rev = prev_revision
@@ -381,7 +381,10 @@ class tree_mergeinfo():
 				self.paths_dict['..'] = parent_mergeinfo
 		return self
 
-	def add_tree_mergeinfo(self, src_tree_mergeinfo, prev_path_prefix = "", new_path_prefix = ""):
+	### add_tree_mergeinfo adds mergeinfo from src_tree_mergeinfo.
+	# If built_mergeinfo is given, it's a mergeinfo previously made by build_mergeinfo() for this object.
+	# It's updated with the added mergeinfo, instead of building it again
+	def add_tree_mergeinfo(self, src_tree_mergeinfo, prev_path_prefix = "", new_path_prefix = "", built_mergeinfo=None):
 		was_changed = False
 		assert(type(src_tree_mergeinfo) is tree_mergeinfo)
 		if prev_path_prefix.endswith('/'):
@@ -395,6 +398,7 @@ class tree_mergeinfo():
 				print(f'{prev_path_prefix=},{new_path_prefix=}', file=sys.stderr)
 			assert(new_path_prefix and not new_path_prefix.endswith('/'))
 
+		parent_mergeinfo_dropped = False
 		for path, src_mergeinfo in src_tree_mergeinfo.paths_dict.items():
 			assert(type(src_mergeinfo) is mergeinfo)
 			if prev_path_prefix:
@@ -409,9 +413,21 @@ class tree_mergeinfo():
 				else:
 					path = '..'
 
+			had_parent_mergeinfo = '..' in self.paths_dict
 			if self.add_mergeinfo(path, src_mergeinfo):
 				was_changed = True
+				if built_mergeinfo is not None:
+					built_mergeinfo.add_mergeinfo(src_mergeinfo)
+				if had_parent_mergeinfo and '..' not in self.paths_dict:
+					parent_mergeinfo_dropped = True
 			continue
+
+		if built_mergeinfo is not None and parent_mergeinfo_dropped:
+			# The inherited mergeinfo was dropped by the root mergeinfo.
+			# The combined mergeinfo needs to be built again
+			new_mergeinfo = self.build_mergeinfo()
+			built_mergeinfo.paths_dict = new_mergeinfo.paths_dict
+			built_mergeinfo.normalized = new_mergeinfo.normalized
 		return was_changed
 
 	def build_mergeinfo(self, normalize=False, log_file=None):
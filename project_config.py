@@ -15,6 +15,9 @@
 import sys
 from types import SimpleNamespace
 import re
+import functools
+import copy
+from collections import deque
 import xml.etree.ElementTree as ET
 from pathlib import Path
 from exceptions import Exception_cfg_parse
@@ -31,6 +34,8 @@ from rev_ranges import str_to_ranges
 # In a replacement string, tokenization only goes up to variables
 
 class glob_string_token:
+	__slots__ = ('text', 'capture')
+
 	def __init__(self, text='', capture=False):
 		self.text = text
 		self.capture = capture
@@ -52,17 +57,20 @@ class glob_string_token:
 		token_list.append(self)
 		return
 
-	def adjust_expand_str(self, wildcards, tokens_iter, last_var):
-		#nothing
+	## Appends the substitution string of the token to expand_list.
+	# The tokens are not modified
+	def make_expand_str(self, wildcards, tokens_iter, last_var, expand_list):
+		expand_list.append(self.expand_str())
 		return last_var
 
 	def __repr__(self):
 		return repr(self.text)
 
 class wildcard_token(glob_string_token):
+	__slots__ = ()
+
 	def __init__(self, text, capture):
 		super().__init__(text, capture)
-		self.var = None
 		return
 
 	def regex(self):
@@ -110,16 +118,15 @@ class wildcard_token(glob_string_token):
 		return self.text.startswith('**')
 
 	def expand_str(self):
-		if self.var is None:
-			raise Exception_cfg_parse("Encountered a wildcard '%s' in the substitution string" % self.text)
-		return self.var
+		raise Exception_cfg_parse("Encountered a wildcard '%s' in the substitution string" % self.text)
 
-	def adjust_expand_str(self, wildcards, tokens_iter, last_var):
+	def make_expand_str(self, wildcards, tokens_iter, last_var, expand_list):
 		last_var += 1
 		# Use this specification instead of simple \NN to avoid ambiguity
-		self.var = r'\g<' + str(last_var) + '>'
 		if self.text == '*/':
-			self.var += '/'
+			expand_list.append(r'\g<' + str(last_var) + '>/')
+		else:
+			expand_list.append(r'\g<' + str(last_var) + '>')
 		return last_var
 
 	def __repr__(self):
@@ -127,6 +134,8 @@ class wildcard_token(glob_string_token):
 
 class list_token(glob_string_token):
 	# The token is inserted for a replacement of a variable with a list of values
+	__slots__ = ('values', 'token_list_list', 'var', 'regex_prefix')
+
 	def __init__(self, values, var, token_list_list, text='', capture=False):
 		super().__init__(text, capture)
 		# values is the original list of the variable value
@@ -160,6 +169,8 @@ class list_token(glob_string_token):
 		return 'List var $%s:%s' % (self.var, self.values)
 
 class brace_group_token(list_token):
+	__slots__ = ()
+
 	def __init__(self, text, capture):
 		super().__init__(None, None, [wildcard_token_list('')], text, capture)
 		return
@@ -195,6 +206,7 @@ class brace_group_token(list_token):
 		return 'Match group:'+repr(self.globspec())
 
 class text_token(glob_string_token):
+	__slots__ = ()
 
 	def add_to_token_list(self, token_list, tokens_iter):
 
@@ -206,6 +218,7 @@ class text_token(glob_string_token):
 		return
 
 class slash_token(glob_string_token):
+	__slots__ = ()
 
 	def regex(self):
 		# the text can be reset to empty string
@@ -221,6 +234,8 @@ class slash_token(glob_string_token):
 		return
 
 class subst_token(glob_string_token):
+	__slots__ = ('var',)
+
 	def __init__(self, text, var):
 		super().__init__(text)
 		self.var = var
@@ -236,11 +251,12 @@ class subst_token(glob_string_token):
 		# Use this specification instead of simple \NN to avoid ambiguity
 		return r'\g<' + self.var + '>'
 
-	def adjust_expand_str(self, wildcards, tokens_iter, last_var):
+	def make_expand_str(self, wildcards, tokens_iter, last_var, expand_list):
 		last_var = int(self.var)
 		if last_var > len(wildcards):
 			raise Exception_cfg_parse('Substitution spec "%s" outside of wildcards count (%d)'
 										% (self.text, len(wildcards)))
+		expand_list.append(self.expand_str())
 		# Check if it's followed by a slash:
 		if wildcards[last_var - 1].text != '**/':
 			return last_var
@@ -249,8 +265,9 @@ class subst_token(glob_string_token):
 		if next_token is None:
 			return last_var
 		if type(next_token) is slash_token:
-			next_token.text = ''
-		return next_token.adjust_expand_str(wildcards, tokens_iter, last_var)
+			# The slash is already included in '**/' match
+			return last_var
+		return next_token.make_expand_str(wildcards, tokens_iter, last_var, expand_list)
 
 	def __repr__(self):
 		return 'Subst:'+self.text
@@ -271,76 +288,199 @@ class wildcard_token_list:
 	# The numeric variable names are matched by separate groups 3 and 4
 	tokenize_regex = re.compile(r'/|\$\$|\\\$|\\[{},]|\\|\$\{(?![0-9])(\w+)\}|\$(?![0-9])(\w+)|\${([1-9][0-9]*)}|\$([1-9][0-9]*)|(\*+|\?)|([{},])')
 
-	def tokenizer(self, src, vars_dict):
+	# Compatibility switch: set to True to tokenize with the original tokenize_regex
+	# instead of the character scanner. Both produce the same tokens
+	use_tokenize_regex = False
+
+	DECIMAL_DIGITS = '0123456789'
+	# Characters which can start a token. Anything else is plain text
+	SPECIAL_CHARS = frozenset('/\\$*?{},')
+
+	### The lexer returns tuples of (kind, text, value), where kind is one of:
+	# 'text' - a string to be matched literally (value)
+	# 'slash' - the path separator
+	# 'backslash' - a misplaced backslash character
+	# 'subst' - a numbered substitution spec (value is the number string)
+	# 'wildcard' - a wildcard (value is the wildcard text)
+	# 'brace' - a brace group character (value is the character)
+	# 'var' - a variable reference (value is the variable name)
+	@classmethod
+	def regex_scanner(cls, src):
 		prev_end = 0
-		if not src:
-			return
-
-		for m in self.tokenize_regex.finditer(src):
+		for m in cls.tokenize_regex.finditer(src):
 			start, end = m.span()
 			if prev_end != start:
 				# Return the string between matches, except for empty string
-				yield text_token(src[prev_end:start])
+				yield 'text', None, src[prev_end:start]
 			prev_end = end
 
 			token = m[0]
 			if token == '\\':
-				raise Exception_cfg_parse('Encountered a misplaced backslash character')
+				yield 'backslash', token, None
+			elif token == '/':
+				yield 'slash', token, token
+			elif token == '$$' or token[0] == '\\':
+				yield 'text', token, token[1:]
+			elif m[3] or m[4]:
+				yield 'subst', token, m[3] or m[4]
+			elif m[5]:
+				yield 'wildcard', token, m[5]
+			elif m[6]:
+				yield 'brace', token, m[6]
+			elif m[1] or m[2]:
+				yield 'var', token, m[1] or m[2]
+			else:
+				yield 'text', token, token
 
-			if token == '/':
-				yield slash_token(token)
+		if prev_end != len(src):
+			# Return the string between matches, except for empty string
+			yield 'text', None, src[prev_end:]
+		return
+
+	### This is a single pass scanner, equivalent to tokenize_regex,
+	# which dispatches on the first character of a token
+	@classmethod
+	def scanner(cls, src):
+		special_chars = cls.SPECIAL_CHARS
+		digits = cls.DECIMAL_DIGITS
+		length = len(src)
+		text_start = 0
+		i = 0
+		while i < length:
+			c = src[i]
+			if c not in special_chars:
+				i += 1
+				continue
+
+			start = i
+			i += 1
+			next_c = src[i:i+1]
+			if c == '/':
+				token = ('slash', c, c)
+			elif c == '\\':
+				if next_c and next_c in '${},':
+					i += 1
+					token = ('text', src[start:i], next_c)
+				else:
+					token = ('backslash', c, None)
+			elif c == '$':
+				if next_c == '$':
+					i += 1
+					token = ('text', '$$', '$')
+				else:
+					if next_c == '{':
+						name_end = src.find('}', i + 1)
+						name = src[i+1:name_end] if name_end > 0 else ''
+						end = name_end + 1
+					else:
+						name_end = i
+						while name_end < length and (src[name_end].isalnum() or src[name_end] == '_'):
+							name_end += 1
+						name = src[i:name_end]
+						end = name_end
+
+					if not name or not all(ch.isalnum() or ch == '_' for ch in name):
+						# Not a variable reference, '$' is a literal character
+						continue
+
+					if name[0] not in digits:
+						token = ('var', src[start:end], name)
+					elif name[0] == '0':
+						continue
+					else:
+						# Only decimal digits make the substitution number
+						digits_end = 1
+						while digits_end < len(name) and name[digits_end] in digits:
+							digits_end += 1
+						if digits_end != len(name):
+							if next_c == '{':
+								continue
+							name = name[:digits_end]
+							end = i + digits_end
+						token = ('subst', src[start:end], name)
+					i = end
+			elif c == '*':
+				while i < length and src[i] == '*':
+					i += 1
+				token = ('wildcard', src[start:i], src[start:i])
+			elif c == '?':
+				token = ('wildcard', c, c)
+			else:
+				token = ('brace', c, c)
+
+			if text_start != start:
+				# Return the string between tokens, except for empty string
+				yield 'text', None, src[text_start:start]
+			text_start = i
+			yield token
+
+		if text_start != length:
+			yield 'text', None, src[text_start:]
+		return
+
+	def tokenizer(self, src, vars_dict):
+		if not src:
+			return
+
+		if self.use_tokenize_regex:
+			lexer = self.regex_scanner(src)
+		else:
+			lexer = self.scanner(src)
+
+		for (kind, token, var) in lexer:
+			if kind == 'text':
+				yield text_token(var)
 				continue
 
-			if token == '$$' or token[0] == '\\':
-				yield text_token(token[1:])
+			if kind == 'slash':
+				yield slash_token(token)
 				continue
 
-			var = m[3]
-			if not var:
-				var = m[4]
-			if var:
+			if kind == 'backslash':
+				raise Exception_cfg_parse('Encountered a misplaced backslash character')
+
+			if kind == 'subst':
 				yield subst_token(token, var)
 				continue
 
-			var = m[5]
-			if var:
+			if kind == 'wildcard':
 				yield wildcard_token(var, self.capture)
 				continue
 
-			var = m[6]
-			if var:
+			if kind == 'brace':
 				yield brace_group_token(var, self.capture)
 				continue
 
-			var = m[1]
-			if not var:
-				var = m[2]
-			if not var:
-				yield text_token(token)
-				continue
-
-			value = vars_dict[var]	# will raise KeyError if not in dictionary
+			value = vars_dict.get(var)
+			if value is None:
+				if var in vars_dict:
+					raise Exception_cfg_parse(
+						'Replacement in "%s": Variable $%s recursively referred'
+						% (self.src, var))
+				raise Exception_cfg_parse(
+					'Replacement in "%s": Variable $%s not defined in any <Vars> specification:'
+					% (self.src, var))
 
 			# Perform recursive replacement, but make sure there's no cycle
 			new_vars_dict = vars_dict.copy()
-			# Delete the name from the copy of the dictionary after having referred
-			del new_vars_dict[var]
+			# Mark the name as referred in the copy of the dictionary
+			new_vars_dict[var] = None
 			# Variable can be a list value
 			if len(value) > 1:
 				yield list_token(value, var,
-					list(wildcard_token_list(item, new_vars_dict) for item in value))
+					list(wildcard_token_list(item, new_vars_dict, top_src=self.src) for item in value))
 			else:
 				yield from self.tokenizer(value[0], new_vars_dict)
 			continue
 
-		if prev_end != len(src):
-			# Return the string between matches, except for empty string
-			yield text_token(src[prev_end:])
-
 		return
 
-	def __init__(self, src, vars_dict={}, capture=False):
+	def __init__(self, src, vars_dict={}, capture=False, top_src=None):
+		# top_src is the original string, for error messages
+		self.src = src if top_src is None else top_src
 		self.tokens = []
+		# Set when any of the tokens may match a slash
+		self.contains_slashes = False
 		self.capture = capture
 		tokens_iter = self.tokenizer(src, vars_dict)
 
@@ -356,19 +496,18 @@ class wildcard_token_list:
 		return self.tokens[index]
 
 	def append(self, token):
+		if not self.contains_slashes and token.contains_slash():
+			self.contains_slashes = True
 		return self.tokens.append(token)
 
 	def has_slashes(self, tokens=None):
 		# A path component may have embedded slashes if any of its group matches
 		# has embedded slashes,
 		# Or it contains a '** wildcard
-		if tokens is None:
-			tokens = self.tokens
-		for token in tokens:
-			if token.contains_slash():
-				return True
+		if tokens is None or tokens is self.tokens:
+			return self.contains_slashes
 
-		return False
+		return any(token.contains_slash() for token in tokens)
 
 	def regex(self, tokens=None):
 
@@ -411,11 +550,13 @@ class wildcard_token_list:
 			# Remove the first slash. The spec always matches from the beginning of path
 			tokens.pop(0)
 		elif (list_len == 1 or not ends_with_slash) \
-				and self.has_slashes(tokens):
+				and (self.contains_slashes or list_len != len(self.tokens)):
 			# A slash is present somewhere in the middle
+			# (if a trailing slash has been added, the list length differs from self.tokens)
 			pass
 		elif list_len > 1 and ends_with_slash \
-				and self.has_slashes(tokens[:-1]):
+				and (self.contains_slashes if list_len != len(self.tokens)
+					else self.has_slashes(tokens[:-1])):
 			pass
 		else:
 			# prepend "any" prefix, but only if there's no directory separators in the nested lists
@@ -444,20 +585,29 @@ class wildcard_token_list:
 	def globspec(self):
 		return ''.join(token.globspec() for token in self.tokens)
 
-	def expand_str(self, wildcards=None):
-		tokens = self.tokens
-		if wildcards is not None:
-			tokens = tokens.copy()
-			# Check the substitutions against the match string
-			# **/ must match **/
-			# Make an array of wildcard objects
+	## Returns the literal string which the regex for these tokens always begins with
+	def literal_prefix(self, tokens):
+		prefix = []
+		for token in tokens:
+			if type(token) is not text_token and type(token) is not slash_token:
+				break
+			prefix.append(token.text)
+		return ''.join(prefix)
 
-			last_var = 0
-			tokens_iter = iter(tokens)
-			for token in tokens_iter:
-				last_var = token.adjust_expand_str(wildcards, tokens_iter, last_var)
+	def expand_str(self, wildcards=None):
+		if wildcards is None:
+			return ''.join(token.expand_str() for token in self.tokens)
+
+		# Check the substitutions against the match string
+		# **/ must match **/
+		# The string is built in a single pass, without modifying the tokens
+		expand_list = []
+		last_var = 0
+		tokens_iter = iter(self.tokens)
+		for token in tokens_iter:
+			last_var = token.make_expand_str(wildcards, tokens_iter, last_var, expand_list)
 
-		return ''.join(token.expand_str() for token in tokens)
+		return ''.join(expand_list)
 
 	def get_capture_list(self):
 		wildcards = []
@@ -468,20 +618,7 @@ class wildcard_token_list:
 
 class wildcard_parser:
 	def __init__(self, src, vars_dict={}, capture=False):
-		try:
-			self.token_list = wildcard_token_list(src, vars_dict, capture)
-
-		except KeyError as ex:
-			key = ex.args[0]
-			if key not in vars_dict:
-				raise Exception_cfg_parse(
-					'Replacement in "%s": Variable $%s not defined in any <Vars> specification:'
-					% (src, key))
-			else:
-				raise Exception_cfg_parse(
-					'Replacement in "%s": Variable $%s recursively referred'
-					% (src, key))
-
+		self.token_list = wildcard_token_list(src, vars_dict, capture)
 		return
 
 	def globspec(self):
@@ -490,10 +627,15 @@ class wildcard_parser:
 	def expand_str(self, wildcards=None):
 		return self.token_list.expand_str(wildcards)
 
-	def regex(self, match_dirs, match_files):
-		tokens = self.token_list.adjust(match_dirs, match_files)
+	def adjust(self, match_dirs, match_files):
+		return self.token_list.adjust(match_dirs, match_files)
+
+	def regex(self, tokens):
 		return self.token_list.regex(tokens)
 
+	def literal_prefix(self, tokens):
+		return self.token_list.literal_prefix(tokens)
+
 	def get_capture_list(self):
 		return self.token_list.get_capture_list()
 
@@ -503,8 +645,11 @@ class glob_match:
 
 		parser = wildcard_parser(match_pattern, vars_dict, capture=capture)
 
-		self.regex = parser.regex(match_dirs=match_dirs, match_files=match_files)
+		tokens = parser.adjust(match_dirs=match_dirs, match_files=match_files)
+		self.regex = parser.regex(tokens)
 		self.re = re.compile(self.regex)
+		# Any matching string begins with this prefix
+		self.literal_prefix = parser.literal_prefix(tokens)
 		self.globspec = parser.globspec()
 		if match_dirs and not match_files and not self.globspec.endswith('/'):
 			self.globspec += '/'
@@ -528,10 +673,31 @@ class glob_match:
 	def get_capture_list(self):
 		return self.wildcards
 
+## glob_match objects are not modified after construction,
+# and can be shared by all configurations with same variables.
+# vars_key is a sorted tuple of (name, tuple of values), as made by make_vars_key()
+@functools.lru_cache(maxsize=1024)
+def cached_glob_match(match_pattern, vars_key, match_dirs=False, match_files=False, capture=False):
+	vars_dict = {var : list(values) for (var, values) in vars_key}
+	return glob_match(match_pattern, vars_dict, match_dirs=match_dirs, match_files=match_files, capture=capture)
+
+## Returns a hashable key for a variables dictionary, to use with cached_glob_match
+def make_vars_key(vars_dict):
+	return tuple(sorted((var, tuple(values)) for (var, values) in vars_dict.items()))
+
+@functools.lru_cache(maxsize=512)
+def compile_regex(pattern, flags=0):
+	return re.compile(pattern, flags)
+
 class glob_expand:
-	def __init__(self, expand_pattern, vars_dict={}, glob_match = None):
+	def __init__(self, expand_pattern, vars_dict={}, glob_match = None, expand_str=None):
 		self.expand_pattern = expand_pattern
 
+		if expand_str is not None:
+			# The pattern has already been parsed for same wildcards
+			self.expand_str = expand_str
+			return
+
 		if glob_match is not None:
 			wildcards = glob_match.get_capture_list()
 		else:
@@ -556,11 +722,22 @@ class glob_expand:
 # can be escaped with a backslash.
 # A segment starting with '!' makes a negative specification. If it matches,
 # matching of the list will be stopped with result False
+# All specifications are combined to a single regular expression
+# of alternatives, one per specification, in the list order.
+# The first matching alternative is identified by Match.lastindex
 class path_list_match:
 	def __init__(self, *values, vars_dict={}, match_dirs=False, match_files=False, split=';'):
 		self.match_list = []
 		self.match_dirs = match_dirs
 		self.match_files = match_files
+		# The combined regex is compiled on first use
+		self.combined_re = None
+		# Maps a group index of the combined regex to the specification polarity
+		self.group_positive = {}
+		self.has_positive = False
+		# If all specifications begin with a literal prefix,
+		# a path not starting with any of them is rejected without running the regex
+		self.literal_prefixes = None
 
 		return self.append(*values, vars_dict=vars_dict, split=split)
 
@@ -569,6 +746,7 @@ class path_list_match:
 
 	def append(self, *values, vars_dict={}, split=';'):
 
+		vars_key = make_vars_key(vars_dict)
 		for src in values:
 			for s in src.split(split):
 				if not s:
@@ -581,10 +759,32 @@ class path_list_match:
 				elif s.startswith('\\!'):
 					s = s[1:]
 
-				self.match_list.append( (glob_match(s, vars_dict,
+				self.match_list.append( (cached_glob_match(s, vars_key,
 								match_dirs=self.match_dirs, match_files=self.match_files), positive) )
+				if positive:
+					self.has_positive = True
+				self.combined_re = None
 		return
 
+	def compile(self):
+		regex_list = []
+		self.group_positive = {}
+		group = 1
+		for (m, positive) in self.match_list:
+			regex_list.append('(' + m.regex + ')')
+			self.group_positive[group] = positive
+			# Skip the groups nested in this specification
+			group += m.re.groups + 1
+
+		prefixes = tuple(m.literal_prefix for (m, positive) in self.match_list)
+		if all(prefixes):
+			self.literal_prefixes = prefixes
+		else:
+			self.literal_prefixes = None
+
+		self.combined_re = re.compile('|'.join(regex_list))
+		return self.combined_re
+
 	# If all match specifications are negative,
 	# Or the list is empty, the function will return
 	# 'return_for_no_positive'.
@@ -595,20 +795,46 @@ class path_list_match:
 	# the function returns return_for_no_positive.
 	# If you want an empty list to match all, pass return_for_no_positive=True
 	def match(self, path, return_for_no_positive=None):
-		for (m, positive) in self.match_list:
-			if m.match(path):
-				return positive
-			if positive:
-				return_for_no_positive = None
+		if not self.match_dirs or self.match_files:
+			# glob_match.match is redirected to fullmatch
+			return self.fullmatch(path, return_for_no_positive)
+
+		if not self.match_list:
+			return return_for_no_positive
+
+		combined_re = self.combined_re
+		if combined_re is None:
+			combined_re = self.compile()
+
+		if self.literal_prefixes is not None \
+				and not path.startswith(self.literal_prefixes):
+			m = None
+		else:
+			m = combined_re.match(path)
+		if m:
+			return self.group_positive[m.lastindex]
+		if self.has_positive:
+			return None
 		# "Match not found" differs from "negative match found"
 		return return_for_no_positive
 
 	def fullmatch(self, path, return_for_no_positive=None):
-		for (m, positive) in self.match_list:
-			if m.fullmatch(path):
-				return positive
-			if positive:
-				return_for_no_positive = None
+		if not self.match_list:
+			return return_for_no_positive
+
+		combined_re = self.combined_re
+		if combined_re is None:
+			combined_re = self.compile()
+
+		if self.literal_prefixes is not None \
+				and not path.startswith(self.literal_prefixes):
+			m = None
+		else:
+			m = combined_re.fullmatch(path)
+		if m:
+			return self.group_positive[m.lastindex]
+		if self.has_positive:
+			return None
 		# "Match not found" differs from "negative match found"
 		return return_for_no_positive
 
@@ -622,6 +848,7 @@ class refs_list_match:
 		return repr(self.match_list)
 
 	def append(self, *values, vars_dict={}, split=';'):
+		vars_key = make_vars_key(vars_dict)
 		for src in values:
 			for s in src.split(split):
 				if not s:
@@ -641,7 +868,7 @@ class refs_list_match:
 				else:
 					namespaces = ['']
 
-				self.match_list += [(glob_match(s, vars_dict, match_dirs=True, match_files=True),
+				self.match_list += [(cached_glob_match(s, vars_key, match_dirs=True, match_files=True),
 						 namespace, positive) for namespace in namespaces]
 		return
 
@@ -659,15 +886,18 @@ class refs_list_match:
 		# "Match not found" differs from "negative match found"
 		return return_for_no_positive
 
+BOOL_PROPERTY_FALSE = frozenset(('no', 'false', '0'))
+BOOL_PROPERTY_TRUE = frozenset(('yes', 'true', '1'))
+
 def bool_property_value(node, property_name, default=False):
-	prop = node.get(property_name)
+	prop = node.attrib.get(property_name)
 	if prop is None:
 		return default
 
 	prop = prop.lower()
-	if prop == 'no' or prop == 'false' or prop == '0':
+	if prop in BOOL_PROPERTY_FALSE:
 		return False
-	if prop == 'yes' or prop == 'true' or prop == '1':
+	if prop in BOOL_PROPERTY_TRUE:
 		return True
 	ex = ValueError('ERROR: Invalid bool value %s="%s" in <%s> node' % (property_name, node.get(property_name), node.tag))
 	ex.property_name = property_name
@@ -726,7 +956,7 @@ def recreate_merges_property_value(node, default=None):
 	return recreate_merges
 
 def int_property_value(node, property_name, default=None, valid_range=None):
-	value_text = node.get(property_name)
+	value_text = node.attrib.get(property_name)
 	if value_text is None:
 		return default
 	try:
@@ -741,20 +971,24 @@ def int_property_value(node, property_name, default=None, valid_range=None):
 	return value
 
 class path_map:
+	# Matches a path regex which ends with a number of '/([^/]+)' strings,
+	# produced by trailing /* or /** specifications
+	block_upper_level_regex_match = re.compile(r'(.*?)(%s)+/?' % re.escape('/([^/]+)'))
+
 	def __init__(self, cfg, path, refname, alt_refname=None, revisions_ref=None, block_upper_level=True):
 		self.cfg = cfg
-		self.path_match = glob_match(path, cfg.replacement_vars, match_dirs=True, match_files=False, capture=True)
+		self.path_match = cfg.make_glob_match(path, match_dirs=True, match_files=False, capture=True)
 
 		if refname:
-			self.refname_sub = glob_expand(refname, cfg.replacement_vars, self.path_match)
+			self.refname_sub = cfg.make_glob_expand(refname, self.path_match)
 
 			if alt_refname:
-				self.alt_refname_sub = glob_expand(alt_refname, cfg.replacement_vars, self.path_match)
+				self.alt_refname_sub = cfg.make_glob_expand(alt_refname, self.path_match)
 			else:
 				self.alt_refname_sub = None
 
 			if revisions_ref:
-				self.revs_ref_sub = glob_expand(revisions_ref, cfg.replacement_vars, self.path_match)
+				self.revs_ref_sub = cfg.make_glob_expand(revisions_ref, self.path_match)
 			else:
 				self.revs_ref_sub = None
 		else:
@@ -782,7 +1016,7 @@ class path_map:
 			# to block it from creating branches.
 			# Such regular expression would end in a number of
 			# '/([^/]+)' strings
-			match = re.fullmatch(r'(.*?)(%s)+/?' % re.escape('/([^/]+)'), self.path_match.regex)
+			match = self.block_upper_level_regex_match.fullmatch(self.path_match.regex)
 			if match:
 				# Since the wildcard matches all subdirectories, add an exclusion map for the
 				# enclosing directory:
@@ -804,12 +1038,7 @@ class path_map:
 				if m:
 					# This path matches a regular expression which blocks the upper level path
 					# from creating a branch.
-					return SimpleNamespace(
-						path=m[0],
-						globspec=self.path_match.globspec,
-						refname=None,
-						alt_refname=None,
-						revisions_ref=None)
+					return path_map_match(m[0], self.path_match.globspec)
 			return None
 
 		path = m[0]
@@ -818,12 +1047,7 @@ class path_map:
 
 		if not self.refname_sub:
 			# This ref map suppresses creation of a branch
-			return SimpleNamespace(
-				path=path,
-				globspec=self.path_match.globspec,
-				refname=None,
-				alt_refname=None,
-				revisions_ref=None)
+			return path_map_match(path, self.path_match.globspec)
 
 		refname = self.refname_sub.expand(m)
 
@@ -845,25 +1069,56 @@ class path_map:
 		else:
 			revisions_ref = None
 
-		return SimpleNamespace(
-			path=path,
-			globspec=self.path_match.globspec,
-			refname=refname,
-			alt_refname=alt_refname,
-			edit_msg_list=self.edit_msg_list,
-			skip_commit_list=self.skip_commit_list,
-			inherit_mergeinfo=self.inherit_mergeinfo,
-			ignore_unmerged=self.ignore_unmerged,
-			delete_if_merged=self.delete_if_merged,
-			recreate_merges=self.recreate_merges,
-			inject_files=self.inject_files,
-			link_orphans=self.link_orphans,
-			ignore_files=self.ignore_files,
-			format_specifications=self.format_specifications,
-			add_tree_prefix=self.add_tree_prefix,
-			merge_to_parent=self.merge_to_parent,
-			lazy_merge_to_parent=self.lazy_merge_to_parent,
-			revisions_ref=revisions_ref)
+		return path_map_match(path, self.path_match.globspec,
+			refname, alt_refname, revisions_ref, self)
+
+### An <EditMsg> specification, made by project_config.process_edit_msg_node()
+class edit_msg_spec:
+	__slots__ = ('match', 'replace', 'revs', 'branch', 'max_sub', 'final')
+
+	def __init__(self, match, replace, revs, branch, max_sub, final):
+		self.match = match
+		self.replace = replace
+		self.revs = revs
+		self.branch = branch
+		self.max_sub = max_sub
+		self.final = final
+		return
+
+### path_map.match() returns this object.
+# If the path is not mapped to a branch (refname is None),
+# only path, globspec, refname, alt_refname and revisions_ref attributes are set.
+# 'cfg' attribute is set by the caller
+class path_map_match:
+	__slots__ = ('path', 'globspec', 'refname', 'alt_refname', 'revisions_ref',
+			'edit_msg_list', 'skip_commit_list', 'inherit_mergeinfo', 'ignore_unmerged',
+			'delete_if_merged', 'recreate_merges', 'inject_files', 'link_orphans',
+			'ignore_files', 'format_specifications', 'add_tree_prefix',
+			'merge_to_parent', 'lazy_merge_to_parent', 'cfg')
+
+	def __init__(self, path, globspec, refname=None, alt_refname=None, revisions_ref=None, path_map=None):
+		self.path = path
+		self.globspec = globspec
+		self.refname = refname
+		self.alt_refname = alt_refname
+		self.revisions_ref = revisions_ref
+		if path_map is None:
+			return
+
+		self.edit_msg_list = path_map.edit_msg_list
+		self.skip_commit_list = path_map.skip_commit_list
+		self.inherit_mergeinfo = path_map.inherit_mergeinfo
+		self.ignore_unmerged = path_map.ignore_unmerged
+		self.delete_if_merged = path_map.delete_if_merged
+		self.recreate_merges = path_map.recreate_merges
+		self.inject_files = path_map.inject_files
+		self.link_orphans = path_map.link_orphans
+		self.ignore_files = path_map.ignore_files
+		self.format_specifications = path_map.format_specifications
+		self.add_tree_prefix = path_map.add_tree_prefix
+		self.merge_to_parent = path_map.merge_to_parent
+		self.lazy_merge_to_parent = path_map.lazy_merge_to_parent
+		return
 
 class svn_revision_action:
 	def __init__(self, action, path, kind=None, copyfrom_path=None, copyfrom_rev=None, text_content=None):
@@ -894,6 +1149,10 @@ class project_config:
 		self.inject_files = []
 		self.ignore_files = path_list_match(match_dirs=True, match_files=True)
 		self.replacement_vars = {}
+		# Parsed expansion strings, keyed by (pattern, wildcards)
+		self.expand_str_cache = {}
+		# Hashable copy of replacement_vars, made on demand
+		self.vars_key = None
 		self.replacement_chars = {}
 		self.gitattributes = []
 		self.paths = path_list_match(match_dirs=True)
@@ -905,8 +1164,10 @@ class project_config:
 		self.empty_placeholder_name = None
 		self.empty_placeholder_text = None
 		self.chars_repl_re = None
+		self.chars_translate_table = None
 		self.explicit_only = False
 		self.needs_configs = ""
+		self.needs_configs_list = []
 		self.inherit_mergeinfo = False
 		self.ignore_unmerged = None
 		self.recreate_merges = SimpleNamespace(branch_merge=False, file_merge=False, dir_copy=False, file_copy=False)
@@ -914,6 +1175,26 @@ class project_config:
 			self.load(xml_node)
 		return
 
+	## Handlers for the child nodes of a project XML element, called as handler(self, node)
+	node_handlers = {
+		'Vars' : lambda self, node: self.add_vars_node(node),
+		'Formatting' : lambda self, node: self.format_specifications.append(self.process_formatting_node(node)),
+		'MapPath' : lambda self, node: self.add_path_map_node(node),
+		'CopyPath' : lambda self, node: self.add_path_copy_node(node),
+		'MergePath' : lambda self, node: self.add_path_merge_node(node),
+		'UnmapPath' : lambda self, node: self.add_path_unmap_node(node),
+		'Replace' : lambda self, node: self.add_char_replacement_node(node),
+		'MapRef' : lambda self, node: self.add_ref_map_node(node),
+		'EditMsg' : lambda self, node: self.edit_msg_list.append(self.process_edit_msg_node(node)),
+		'SkipCommit' : lambda self, node: self.skip_commit_list.append(self.process_skip_commit_node(node)),
+		'InjectFile' : lambda self, node: self.inject_files.append(self.process_injected_file(node)),
+		'AddFile' : lambda self, node: self.process_add_file(node),
+		'IgnoreFiles' : lambda self, node: self.ignore_files.append(node.text, vars_dict=self.replacement_vars),
+		'DeletePath' : lambda self, node: self.process_delete_file(node),
+		'Chmod' : lambda self, node: self.add_chmod_node(node),
+		'EmptyDirPlaceholder' : lambda self, node: self.process_empty_dir_placeholder(node),
+	}
+
 	## Copies project configuration settings from XML element
 	def load(self, xml_node):
 		# <Project ExplicitOnly=Yes"> sections are only used when explicitly selected
@@ -921,54 +1202,20 @@ class project_config:
 		# <Project ExplicitOnly=Yes"> sections are not used
 		self.explicit_only = bool_property_value(xml_node, "ExplicitOnly", False)
 		self.needs_configs = xml_node.get("NeedsProjects", "")
+		self.needs_configs_list = [name for name in self.needs_configs.split(',') if name]
 		self.inherit_mergeinfo = bool_property_value(xml_node, 'InheritMergeinfo', True)
 		self.recreate_merges = recreate_merges_property_value(xml_node)
 		self.ignore_unmerged = xml_node.get("IgnoreUnmerged", "")
 
 		self.name = xml_node.get('Name', '')
 
-		for node in xml_node.findall("./*"):
+		node_handlers = self.node_handlers
+		# Iterating the element directly returns its child elements, same as findall("./*")
+		for node in xml_node:
 			tag = str(node.tag)
-			if tag == 'Vars':
-				self.add_vars_node(node)
-			elif tag == 'Formatting':
-				self.format_specifications.append(self.process_formatting_node(node))
-			elif tag == 'MapPath':
-				self.add_path_map_node(node)
-			elif tag == 'CopyPath':
-				self.add_path_copy_node(node)
-			elif tag == 'MergePath':
-				self.add_path_merge_node(node)
-			elif tag == 'UnmapPath':
-				self.add_path_unmap_node(node)
-			elif tag == 'Replace':
-				self.add_char_replacement_node(node)
-			elif tag == 'MapRef':
-				self.add_ref_map_node(node)
-			elif tag == 'EditMsg':
-				self.edit_msg_list.append(self.process_edit_msg_node(node))
-			elif tag == 'SkipCommit':
-				self.skip_commit_list.append(self.process_skip_commit_node(node))
-			elif tag == 'InjectFile':
-				self.inject_files.append(self.process_injected_file(node))
-			elif tag == 'AddFile':
-				self.process_add_file(node)
-			elif tag == 'IgnoreFiles':
-				self.ignore_files.append(node.text, vars_dict=self.replacement_vars)
-			elif tag == 'DeletePath':
-				self.process_delete_file(node)
-			elif tag == 'Chmod':
-				self.add_chmod_node(node)
-			elif tag == 'EmptyDirPlaceholder':
-				filename = node.get('Name')
-				if not filename:
-					print("WARNING: <EmptyDirPlaceholder missing Name='' attribute")
-					continue
-				self.empty_placeholder_name = filename
-				if node.text is None:
-					self.empty_placeholder_text = ''
-				else:
-					self.empty_placeholder_text = str(node.text)
+			handler = node_handlers.get(tag)
+			if handler is not None:
+				handler(self, node)
 			elif node.get('FromDefault'):
 				if node.get('FromDefault') == 'Yes':
 					print("WARNING: Unrecognized tag <%s> in <Default>" % tag, file=sys.stderr)
@@ -981,7 +1228,19 @@ class project_config:
 
 		self.refs.append(xml_node.get('Refs', '*'), vars_dict=self.replacement_vars)
 
-		self.make_chars_replacement_regex()
+		self.build_char_replacement()
+		return
+
+	def process_empty_dir_placeholder(self, node):
+		filename = node.get('Name')
+		if not filename:
+			print("WARNING: <EmptyDirPlaceholder missing Name='' attribute")
+			return
+		self.empty_placeholder_name = filename
+		if node.text is None:
+			self.empty_placeholder_text = ''
+		else:
+			self.empty_placeholder_text = str(node.text)
 		return
 
 	def add_revision_action(self, rev, action):
@@ -1008,13 +1267,13 @@ class project_config:
 	#	</MapPath>
 
 	def add_vars_node(self, node):
-		for vnode in node.findall("./*"):
+		for vnode in node:
 			if vnode.tag:
 				self.add_replacement_var(vnode.tag, vnode.text)
 		return
 
 	def add_chmod_node(self, node):
-		path_node = node.find("./Path")
+		path_node = node.find("Path")
 		if path_node is None:
 			raise Exception_cfg_parse("Missing <Path> node in <Chmod>")
 
@@ -1022,7 +1281,7 @@ class project_config:
 		if not path:
 			raise Exception_cfg_parse("Missing directory pattern in <Chmod><Path> node")
 
-		mask_node = node.find("./Mode")
+		mask_node = node.find("Mode")
 		if mask_node is None:
 			raise Exception_cfg_parse("Missing <Mode> node in <Chmod>")
 
@@ -1042,6 +1301,9 @@ class project_config:
 		return
 
 	def add_replacement_var(self, var, text):
+		# The cached expansion strings may depend on the variable
+		self.expand_str_cache.clear()
+		self.vars_key = None
 		if text is None:
 			self.replacement_vars.pop(var, '')
 			return
@@ -1055,9 +1317,32 @@ class project_config:
 		self.replacement_vars[var] = t.split(';')
 		return
 
+	def get_vars_key(self):
+		if self.vars_key is None:
+			self.vars_key = make_vars_key(self.replacement_vars)
+		return self.vars_key
+
+	## Returns a glob_match object, which may be shared with other configurations
+	def make_glob_match(self, match_pattern, match_dirs=False, match_files=False, capture=False):
+		return cached_glob_match(match_pattern, self.get_vars_key(), match_dirs, match_files, capture)
+
+	## Makes a glob_expand object for the pattern, to expand matches of glob_match object.
+	# A substitution string only depends on the pattern, the variables,
+	# and the wildcards of the match pattern, so the pattern is parsed only once
+	# for all maps with same wildcards
+	def make_glob_expand(self, expand_pattern, glob_match):
+		key = (expand_pattern, tuple(token.text for token in glob_match.get_capture_list()))
+		expand_str = self.expand_str_cache.get(key)
+		if expand_str is not None:
+			return glob_expand(expand_pattern, glob_match=glob_match, expand_str=expand_str)
+
+		expand = glob_expand(expand_pattern, self.replacement_vars, glob_match)
+		self.expand_str_cache[key] = expand.expand_str
+		return expand
+
 	def add_path_map_node(self, path_map_node):
 
-		node = path_map_node.find("./Path")
+		node = path_map_node.find("Path")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Path> node in <MapPath>")
 
@@ -1065,7 +1350,7 @@ class project_config:
 		if not path:
 			raise Exception_cfg_parse("Missing directory pattern in <MapPath><Path> node")
 
-		node = path_map_node.find("./Refname")
+		node = path_map_node.find("Refname")
 		if node is not None:
 			refname = node.text
 		else:
@@ -1074,13 +1359,13 @@ class project_config:
 		if not refname:
 			raise Exception_cfg_parse("Directory mapping for '%s' is missing <Refname> specification. Use <UnmapPath> instead." % path)
 
-		node = path_map_node.find("./AltRefname")
+		node = path_map_node.find("AltRefname")
 		if node is not None and node.text:
 			alt_refname = node.text
 		else:
 			alt_refname = None
 
-		node = path_map_node.find("./RevisionRef")
+		node = path_map_node.find("RevisionRef")
 		if node is not None and node.text:
 			revs_ref = node.text
 		else:
@@ -1095,22 +1380,22 @@ class project_config:
 			# Ignore duplicate mapping from <Default>
 			return
 
-		for node in path_map_node.findall("./EditMsg"):
+		for node in path_map_node.findall("EditMsg"):
 			new_map.edit_msg_list.append(self.process_edit_msg_node(node))
 
-		for node in path_map_node.findall("./SkipCommit"):
+		for node in path_map_node.findall("SkipCommit"):
 			new_map.skip_commit_list.append(self.process_skip_commit_node(node))
 
-		for node in path_map_node.findall("./InjectFile"):
+		for node in path_map_node.findall("InjectFile"):
 			new_map.inject_files.append(self.process_injected_file(node))
 
-		for node in path_map_node.findall("./IgnoreFiles"):
+		for node in path_map_node.findall("IgnoreFiles"):
 			new_map.ignore_files.append(node.text, vars_dict=self.replacement_vars)
 
 		new_map.inherit_mergeinfo = bool_property_value(path_map_node, 'InheritMergeinfo', self.inherit_mergeinfo)
 		new_map.recreate_merges = recreate_merges_property_value(path_map_node, self.recreate_merges)
 
-		for node in path_map_node.findall("./Formatting"):
+		for node in path_map_node.findall("Formatting"):
 			new_map.format_specifications.append(self.process_formatting_node(node))
 
 		new_map.delete_if_merged = bool_property_value(path_map_node, 'DeleteIfMerged')
@@ -1151,7 +1436,7 @@ class project_config:
 				print("WARNING: <UnmapPath> for path '%s' already matched in the config" % unmap.path_match.globspec)
 			return
 
-		if path_unmap_node.findall("./*"):
+		if len(path_unmap_node):
 			print ("WARNING: Subnodes under <UnmapPath>%s</UnmapPath> are ignored" % (path))
 
 		self.map_set.add(unmap.key())
@@ -1161,7 +1446,7 @@ class project_config:
 
 	def add_path_copy_node(self, path_copy_node):
 
-		node = path_copy_node.find("./Path")
+		node = path_copy_node.find("Path")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Path> node in <CopyPath>")
 
@@ -1170,7 +1455,7 @@ class project_config:
 			raise Exception_cfg_parse("Missing directory text in <CopyPath><Path> node")
 		path = path.lstrip('/')
 
-		node = path_copy_node.find("./Rev")
+		node = path_copy_node.find("Rev")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Rev> node in <CopyPath>")
 
@@ -1182,7 +1467,7 @@ class project_config:
 		except ValueError:
 			raise Exception_cfg_parse("Invalid revision number '%s' in <CopyPath><Rev> node" % (rev))
 
-		node = path_copy_node.find("./FromPath")
+		node = path_copy_node.find("FromPath")
 		if node is None:
 			raise Exception_cfg_parse("Missing <FromPath> node in <CopyPath>")
 
@@ -1191,7 +1476,7 @@ class project_config:
 			raise Exception_cfg_parse("Missing pathname text in <CopyPath><FromPath> node")
 		from_path = from_path.lstrip('/')
 
-		node = path_copy_node.find("./FromRev")
+		node = path_copy_node.find("FromRev")
 		if node is None:
 			raise Exception_cfg_parse("Missing <FromRev> node in <CopyPath>")
 
@@ -1212,7 +1497,7 @@ class project_config:
 
 	def add_path_merge_node(self, path_merge_node):
 
-		node = path_merge_node.find("./Path")
+		node = path_merge_node.find("Path")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Path> node in <MergePath>")
 
@@ -1223,7 +1508,7 @@ class project_config:
 		if not path.endswith('/'):
 			path += '/'
 
-		node = path_merge_node.find("./Rev")
+		node = path_merge_node.find("Rev")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Rev> node in <MergePath>")
 
@@ -1235,7 +1520,7 @@ class project_config:
 		except ValueError:
 			raise Exception_cfg_parse("Invalid revision number '%s' in <MergePath><Rev> node" % (rev))
 
-		node = path_merge_node.find("./FromPath")
+		node = path_merge_node.find("FromPath")
 		if node is None:
 			raise Exception_cfg_parse("Missing <FromPath> node in <MergePath>")
 
@@ -1247,7 +1532,7 @@ class project_config:
 		if not from_path.endswith('/'):
 			from_path += '/'
 
-		node = path_merge_node.find("./FromRev")
+		node = path_merge_node.find("FromRev")
 		if node is None:
 			raise Exception_cfg_parse("Missing <FromRev> node in <MergePath>")
 
@@ -1268,7 +1553,7 @@ class project_config:
 
 	def add_ref_map_node(self, ref_map_node):
 
-		node = ref_map_node.find("./Ref")
+		node = ref_map_node.find("Ref")
 		if node is None:
 			raise Exception_cfg_parse("Missing <Ref> node in <MapRef>")
 
@@ -1278,7 +1563,7 @@ class project_config:
 
 		# Replace $name strings:
 		# and create a regex string from path string:
-		refname = glob_match(ref, self.replacement_vars, match_dirs=False, match_files=True, capture=True)
+		refname = self.make_glob_match(ref, match_dirs=False, match_files=True, capture=True)
 
 		if refname.regex in self.ref_map_set:
 			if ref_map_node.get('FromDefault') is None:
@@ -1286,16 +1571,19 @@ class project_config:
 			# Ignore duplicate mapping from <Default>
 			return
 
-		node = ref_map_node.find("./NewRef")
+		node = ref_map_node.find("NewRef")
 		if node is not None:
 			new_refname = node.text
 		else:
 			new_refname = None
 
 		if new_refname:
-			new_refname = glob_expand(new_refname, self.replacement_vars, refname)
+			new_refname = self.make_glob_expand(new_refname, refname)
 
-		ref_map = SimpleNamespace(refname=refname,expand_refname=new_refname)
+		ref_map = SimpleNamespace(refname=refname,expand_refname=new_refname,
+					fullmatch=refname.fullmatch,
+					# Any matching ref begins with this prefix (can be empty)
+					literal_prefix=refname.literal_prefix)
 
 		self.ref_map_set.add(refname.regex)
 		self.ref_map_list.append(ref_map)
@@ -1311,24 +1599,24 @@ class project_config:
 				'Invalid Revs specification "%s" in <EditMsg> node')
 
 		branch = edit_msg_node.get('Branch', '*')
-		branch = glob_match(branch, self.replacement_vars, match_dirs=True, match_files=True)
+		branch = self.make_glob_match(branch, match_dirs=True, match_files=True)
 
 		max_sub = int_property_value(edit_msg_node, 'Max', 0)
 		final = bool_property_value(edit_msg_node, 'Final', False)
-		match_node = edit_msg_node.find('./Match')
+		match_node = edit_msg_node.find('Match')
 		if match_node is None or \
 			not (match := match_node.text):
 			match = '.*'
 			max_sub = 1
 			final = True
 		try:
-			match_re = re.compile(match, re.MULTILINE)
+			match_re = compile_regex(match, re.MULTILINE)
 		except re.error as e:
 			raise Exception_cfg_parse(
 				'Invalid regular expression "%s" as match pattern in <EditMsg><Match> node:\n\t%s' % (match, e.msg))
 
 		# <Replace>substitution</Replace>
-		replace_node = edit_msg_node.find('./Replace')
+		replace_node = edit_msg_node.find('Replace')
 		if replace_node is None:
 			raise Exception_cfg_parse("Missing <Replace> node in <EditMsg>")
 		replace = replace_node.text
@@ -1336,7 +1624,7 @@ class project_config:
 			# Empty text is returned as None
 			replace = ''
 
-		return SimpleNamespace(
+		return edit_msg_spec(
 				match=match_re,
 				replace=replace,
 				revs=revs,
@@ -1357,7 +1645,7 @@ class project_config:
 			raise Exception_cfg_parse(
 				'Revs="revisions" attribute must be present in <SkipCommit> specification')
 
-		message_node = skip_commit_node.find('./Message')
+		message_node = skip_commit_node.find('Message')
 		if message_node is not None:
 			message = message_node.text
 			if message is None:
@@ -1371,29 +1659,69 @@ class project_config:
 				revs=revs)
 
 	def add_char_replacement_node(self, node):
-		chars_node = node.find("./Chars")
-		with_node = node.find("./With")
+		chars_node = node.find("Chars")
+		with_node = node.find("With")
 
 		if chars_node is not None and chars_node.text and with_node is not None and with_node.text is not None:
 			self.replacement_chars[chars_node.text] = with_node.text
 		return
 
-	def make_chars_replacement_regex(self):
+	## If all replaced strings are single characters, which is the case for the default config,
+	# the replacement is done by str.translate with a table made once.
+	# Otherwise, a regular expression made of all replaced strings is used,
+	# to keep the leftmost replacement in the order of <Replace> specifications
+	def build_char_replacement(self):
 		chars_list = self.replacement_chars.keys()
-		if chars_list:
-			self.chars_repl_re = re.compile('|'.join([re.escape(s) for s in chars_list]))
+		self.chars_repl_re = None
+		self.chars_translate_table = None
+		if not chars_list:
+			return
+
+		if all(len(s) == 1 for s in chars_list):
+			self.chars_translate_table = str.maketrans(self.replacement_chars)
+			return
+
+		# Strings are grouped by their first character, so the regex engine
+		# only tries one branch for each distinct first character.
+		# Strings with different first characters never compete with each other;
+		# strings of a group keep their order of precedence.
+		# Single characters which don't start any longer string
+		# are combined into a character class at the end.
+		groups = {}
+		for s in chars_list:
+			groups.setdefault(s[0], []).append(re.escape(s[1:]))
+
+		alternatives = []
+		single_chars = []
+		for (c, tails) in groups.items():
+			if tails == ['']:
+				single_chars.append(re.escape(c))
+			elif len(tails) == 1:
+				alternatives.append(re.escape(c) + tails[0])
+			else:
+				alternatives.append(re.escape(c) + '(?:' + '|'.join(tails) + ')')
+
+		if single_chars:
+			alternatives.append('[' + ''.join(single_chars) + ']')
+		self.chars_repl_re = re.compile('|'.join(alternatives))
+		return
 
 	def apply_char_replacement(self, ref):
+		if self.chars_translate_table is not None:
+			return ref.translate(self.chars_translate_table)
+
 		if not self.chars_repl_re:
 			return ref
 
-		return self.chars_repl_re.sub(lambda m : self.replacement_chars.get(m.group(0), ''), ref)
+		# The regex is made of the dictionary keys, any match is a key
+		getitem = self.replacement_chars.__getitem__
+		return self.chars_repl_re.sub(lambda m : getitem(m[0]), ref)
 
 	def process_injected_file(self, node):
 		branch = None
 		path = node.get('Path')
 		branch = node.get('Branch', '*')
-		branch = glob_match(branch, self.replacement_vars, match_dirs=True, match_files=True)
+		branch = self.make_glob_match(branch, match_dirs=True, match_files=True)
 
 		file = node.get('File')
 		if file:
@@ -1469,7 +1797,7 @@ class project_config:
 		return
 
 	def process_formatting_node(self, node):
-		path_node = node.find("./Path")
+		path_node = node.find("Path")
 		if path_node is None:
 			print("WARNING: <Path node missing in <Formatting>", file=sys.stderr)
 			return
@@ -1595,7 +1923,7 @@ class project_config:
 							else:
 								raise
 
-				for no_reindent_node in node.findall('./NoReindent'):
+				for no_reindent_node in node.findall('NoReindent'):
 					# <NoReindent>pattern</NoReindent>
 					# Specifies line patterns not subject to indentation change (other than replacement of leading tabs<->spaces)
 					# Those lines are still tokenized for context analysis
@@ -1659,18 +1987,47 @@ class project_config:
 		if not ref:
 			return ref
 
-		# Apply MapRef translation patterns.
-		for ref_map in self.ref_map_list:
-			m = ref_map.refname.fullmatch(ref)
-			if m:
-				if not ref_map.expand_refname:
-					return None
-				ref = ref_map.expand_refname.expand(m)
-				break
-			continue
+		# Apply MapRef translation patterns. Most configs don't have any
+		if self.ref_map_list:
+			for ref_map in self.ref_map_list:
+				if not ref.startswith(ref_map.literal_prefix):
+					continue
+				m = ref_map.fullmatch(ref)
+				if m:
+					if not ref_map.expand_refname:
+						return None
+					ref = ref_map.expand_refname.expand(m)
+					break
+				continue
 
 		return self.apply_char_replacement(ref)
 
+	## Tells how merge_cfg_nodes inherits a node from the default config, by its tag:
+	# 'map' - appended, unless InheritDefaultMapping="No"
+	# 'vars' - inserted first, unless InheritDefault="No" (the hardcoded default is always inserted)
+	# 'skip' - not inherited
+	# 'insert' - inserted first, unless InheritDefault="No"
+	# 'append' - appended, unless InheritDefault="No"
+	# Other tags ('override') are appended, unless present in the project config or InheritDefault="No"
+	default_node_kinds = {
+		'MapPath' : 'map',
+		'UnmapPath' : 'map',
+		'Vars' : 'vars',
+		'Replace' : 'vars',
+		'MergePath' : 'skip',
+		'CopyPath' : 'skip',
+		'DeletePath' : 'insert',
+		'Chmod' : 'insert',
+		'EmptyDirPlaceholder' : 'insert',
+		'InjectFile' : 'insert',
+		'AddFile' : 'insert',
+		'MapRef' : 'append',
+		'EditMsg' : 'append',
+		'IgnoreFiles' : 'append',
+		'Formatting' : 'append',
+		'SkipCommit' : 'append',
+	}
+
 	## merge_cfg_nodes combines two ET.Element nodes
 	# into a new node
 	@staticmethod
@@ -1679,24 +2036,28 @@ class project_config:
 			cfg_node = default_node
 			default_node = None
 		merged = ET.Element(cfg_node.tag, cfg_node.attrib.copy())
-		merged.extend(cfg_node.findall("./*"))
-		if not default_node:
+		merged.extend(list(cfg_node))
+		# Element truth value depends on presence of children; test for None explicitly
+		if default_node is None:
 			return merged
 
 		inherit_default = bool_property_value(cfg_node, "InheritDefault", True)
 		inherit_default_mapping = bool_property_value(cfg_node, "InheritDefaultMapping", inherit_default)
 
+		# Tags of specifications present in this config
+		present_tags = {node.tag for node in cfg_node}
+
 		idx = 0
-		for node in default_node.findall("./*"):
-			if node.tag == 'MapPath' or \
-					node.tag == 'UnmapPath':
+		for node in list(default_node):
+			kind = project_config.default_node_kinds.get(node.tag, 'override')
+			if kind == 'map':
 				if not inherit_default_mapping:
 					continue
 				# Map from default config is assigned last to be processed after non-default
 				merged.append(node)
 				node.attrib.setdefault('FromDefault', 'Yes')
 				continue
-			elif node.tag == 'Vars' or node.tag == 'Replace':
+			elif kind == 'vars':
 				# Vars and Replace are always inherited from the hardcoded default
 				if not inherit_default and node.get('HardcodedDefault') != 'Yes':
 					continue
@@ -1705,28 +2066,19 @@ class project_config:
 				idx += 1
 				continue
 
-			if node.tag == 'MergePath' or \
-				node.tag == 'CopyPath':
+			if kind == 'skip':
 				# Not carrying the default MergePath and CopyPath specifications over
 				continue
 
 			if not inherit_default:
 				continue
-			if node.tag == 'DeletePath' or \
-					node.tag == 'Chmod' or \
-					node.tag == 'EmptyDirPlaceholder' or \
-					node.tag == 'InjectFile' or \
-					node.tag == 'AddFile':
+			if kind == 'insert':
 				# These specifications from the default config are assigned first to be overwritten by later override
 				merged.insert(idx, node)
 				idx += 1
 				continue
-			elif node.tag == 'MapRef' or \
-					node.tag == 'EditMsg' or \
-					node.tag == 'IgnoreFiles' or \
-					node.tag == 'Formatting' or \
-					node.tag == 'SkipCommit' or \
-					cfg_node.find("./" + node.tag) is None:
+			elif kind == 'append' or \
+					node.tag not in present_tags:
 				# The rest of tags are not taken as overrides. They are only appended
 				# if not already present in this config
 				# And these specifications from the default config are assigned last to be processed after non-default
@@ -1734,71 +2086,116 @@ class project_config:
 				node.attrib.setdefault('FromDefault', 'Yes')
 		return merged
 
+	default_user_branch_mappings = (
+		('**/$UserBranches/*/*', 'refs/heads/**/users/*/*', None),
+	)
+
+	default_mappings = (
+		('**/$Branches/*', 'refs/heads/**/*', None),
+		('**/$Tags/*', 'refs/tags/**/*', 'refs/heads/**/tags/*'),
+		('**/$Trunk', 'refs/heads/**/$MapTrunkTo', None),
+	)
+
+	default_char_replacements = (
+		(' ', '_'),
+		(':', '.'),
+		('^', '+'),
+	)
+
 	@staticmethod
 	def make_default_config(options=None):
-		vars_section = '''
-		<Trunk>%s</Trunk>
-		<Branches>%s</Branches>
-		<Tags>%s</Tags>
-		<MapTrunkTo>%s</MapTrunkTo>''' % (
+		# The cached tree is never handed out, because the config loading
+		# sets FromDefault attribute in the default nodes
+		return copy.deepcopy(project_config.build_default_config(
 				getattr(options, 'trunk', 'trunk'),
 				getattr(options, 'branches', 'branches'),
 				getattr(options, 'tags', 'tags'),
-				getattr(options, 'map_trunk_to', 'main'))
+				getattr(options, 'map_trunk_to', 'main'),
+				tuple(getattr(options, 'user_branches', ('users/branches', 'branches/users'))),
+				getattr(options, 'use_default_config', True)))
 
-		user_branches = ';'.join(getattr(options, 'user_branches', ['users/branches', 'branches/users']))
+	## The default <Default> tree only depends on these few option values,
+	# and is built once for them. It's made directly as Element objects,
+	# without going through the XML parser.
+	@staticmethod
+	@functools.lru_cache(maxsize=8)
+	def build_default_config(trunk, branches, tags, map_trunk_to, user_branches, use_default_config):
+		default_cfg = ET.Element('Default')
+
+		vars_node = ET.SubElement(default_cfg, 'Vars', HardcodedDefault='Yes')
+		ET.SubElement(vars_node, 'Trunk').text = trunk
+		ET.SubElement(vars_node, 'Branches').text = branches
+		ET.SubElement(vars_node, 'Tags').text = tags
+		ET.SubElement(vars_node, 'MapTrunkTo').text = map_trunk_to
+
+		user_branches = ';'.join(user_branches)
 		if user_branches:
-			vars_section += '\n\t\t<UserBranches>%s</UserBranches>' % user_branches
-			user_branch_mappings = '''
-	<MapPath>
-		<Path>**/$UserBranches/*/*</Path>
-		<Refname>refs/heads/**/users/*/*</Refname>
-	</MapPath>'''
+			ET.SubElement(vars_node, 'UserBranches').text = user_branches
+			default_mappings = project_config.default_user_branch_mappings
 		else:
-			user_branch_mappings = ''
-
-		if getattr(options, 'use_default_config', True):
-			default_mappings = user_branch_mappings + '''
-	<MapPath>
-		<Path>**/$Branches/*</Path>
-		<Refname>refs/heads/**/*</Refname>
-	</MapPath>
-	<MapPath>
-		<Path>**/$Tags/*</Path>
-		<Refname>refs/tags/**/*</Refname>
-		<AltRefname>refs/heads/**/tags/*</AltRefname>
-	</MapPath>
-	<MapPath>
-		<Path>**/$Trunk</Path>
-		<Refname>refs/heads/**/$MapTrunkTo</Refname>
-	</MapPath>'''
+			default_mappings = ()
+
+		if use_default_config:
+			default_mappings += project_config.default_mappings
 		else:
-			default_mappings = ''
-
-		default_cfg = """<Default>
-	<Vars HardcodedDefault="Yes">%s
-	</Vars>%s
-	<Replace HardcodedDefault="Yes">
-		<Chars> </Chars>
-		<With>_</With>
-	</Replace>
-	<Replace HardcodedDefault="Yes">
-		<Chars>:</Chars>
-		<With>.</With>
-	</Replace>
-	<Replace HardcodedDefault="Yes">
-		<Chars>^</Chars>
-		<With>+</With>
-	</Replace>
-</Default>""" % (vars_section, default_mappings)
+			default_mappings = ()
+
+		for (path, refname, alt_refname) in default_mappings:
+			map_node = ET.SubElement(default_cfg, 'MapPath')
+			ET.SubElement(map_node, 'Path').text = path
+			ET.SubElement(map_node, 'Refname').text = refname
+			if alt_refname is not None:
+				ET.SubElement(map_node, 'AltRefname').text = alt_refname
+
+		for (chars, replace_with) in project_config.default_char_replacements:
+			replace_node = ET.SubElement(default_cfg, 'Replace', HardcodedDefault='Yes')
+			ET.SubElement(replace_node, 'Chars').text = chars
+			ET.SubElement(replace_node, 'With').text = replace_with
+
 		return default_cfg
 
+	## Parses the XML config file incrementally, and returns
+	# the direct children of the root <Projects> element as soon as they're complete.
+	# A returned node is then detached from the root, to not keep the whole tree in memory
+	@staticmethod
+	def iterparse_config(xml_filename):
+		root = None
+		depth = 0
+		try:
+			for (event, node) in ET.iterparse(xml_filename, events=('start', 'end')):
+				if event == 'start':
+					if root is None:
+						root = node
+						if root.tag != "Projects":
+							raise Exception_cfg_parse("XML config: root tree must be <Projects>")
+					depth += 1
+					continue
+
+				depth -= 1
+				if depth != 1:
+					continue
+
+				yield node
+				root.remove(node)
+
+		except ET.ParseError as ex:
+			raise Exception_cfg_parse("In XML config file %s: %s" % (xml_filename, ex))
+		return
+
+	## A default config given as XML text is parsed once.
+	# The cached tree must not be modified: the config loading sets FromDefault
+	# attribute in the default nodes. make_config_list works on a copy of it
+	@staticmethod
+	@functools.lru_cache(maxsize=8)
+	def parse_default_config(default_cfg):
+		return ET.XML(default_cfg)
+
 	@staticmethod
 	def make_config_list(xml_filename, project_filters=[], default_cfg=None):
 		# build projects directory
 
-		if default_cfg is not None:
-			default_cfg = ET.XML(default_cfg)
+		if isinstance(default_cfg, str):
+			default_cfg = copy.deepcopy(project_config.parse_default_config(default_cfg))
 
 		configs = set()
 		config_list = []
@@ -1806,62 +2203,76 @@ class project_config:
 		fallback_config = None
 
 		if xml_filename:
-			try:
-				xml_cfg = ET.parse(xml_filename)
-			except ET.ParseError as ex:
-				raise Exception_cfg_parse("In XML config file %s: %s" % (xml_filename, ex))
-
-			root = xml_cfg.getroot()
-			if root.tag != "Projects":
-				raise Exception_cfg_parse("XML config: root tree must be <Projects>")
-
 			# match_dirs=False, match_files=False means literal match
 			project_filter_list = path_list_match(*project_filters, split=',')
 			all_config_list = []
 
-			default_cfg = project_config.merge_cfg_nodes(root.find("./Default"), default_cfg)
+			# <Project> nodes are loaded as soon as they're parsed,
+			# but those encountered before <Default> have to wait for it
+			default_merged = False
+			project_nodes = []
+			project_nodes_count = 0
+			for node in project_config.iterparse_config(xml_filename):
+				if node.tag == 'Project':
+					project_nodes.append(node)
+					project_nodes_count += 1
+				elif node.tag == 'Default':
+					if default_merged:
+						# Only the first <Default> is used
+						continue
+					default_cfg = project_config.merge_cfg_nodes(node, default_cfg)
+					default_merged = True
+				else:
+					continue
+
+				if not default_merged:
+					continue
 
-			project_nodes = root.findall("./Project")
-			for cfg_node in project_nodes:
+				for cfg_node in project_nodes:
+					all_config_list.append(project_config(
+						project_config.merge_cfg_nodes(cfg_node, default_cfg), filename = xml_filename))
+				project_nodes.clear()
 
-				cfg = project_config(project_config.merge_cfg_nodes(cfg_node, default_cfg), filename = xml_filename)
+			if not default_merged:
+				default_cfg = project_config.merge_cfg_nodes(None, default_cfg)
+				for cfg_node in project_nodes:
+					all_config_list.append(project_config(
+						project_config.merge_cfg_nodes(cfg_node, default_cfg), filename = xml_filename))
 
+			for cfg in all_config_list:
 				if cfg.name in configs:
 					raise Exception_cfg_parse("XML config: <Project Name=\"%s\" encountered twice" % cfg.name)
 				configs.add(cfg.name)
-				all_config_list.append(cfg)
 
+			# Select the projects matching the filter,
+			# then add the projects they need, recursively
+			configs_by_name = {cfg.name : cfg for cfg in all_config_list}
 			need_projects = set()
-			selected_config_list = []
-			config_list_chaged= True
-			while config_list_chaged:
-				config_list = []
-				config_list_chaged = False
-				for cfg in all_config_list:
-					if selected_config_list and cfg is selected_config_list[0]:
-						selected_config_list.pop(0)
-						config_list.append(cfg)
-						continue
-
-					if not cfg.explicit_only \
-							and fallback_config is None \
-							and (not cfg.name or cfg.name == '*'):
-						fallback_config = cfg
-
-					if not project_filter_list.match(cfg.name, not cfg.explicit_only) \
-						and not cfg.name in need_projects:
+			selected_configs = set()
+			configs_to_process = deque()
+			for cfg in all_config_list:
+				if not cfg.explicit_only \
+						and fallback_config is None \
+						and (not cfg.name or cfg.name == '*'):
+					fallback_config = cfg
+
+				if project_filter_list.match(cfg.name, not cfg.explicit_only):
+					selected_configs.add(cfg.name)
+					configs_to_process.append(cfg)
+
+			while configs_to_process:
+				cfg = configs_to_process.popleft()
+				for needs_name in cfg.needs_configs_list:
+					need_projects.add(needs_name)
+					if needs_name in selected_configs:
 						continue
+					needed_cfg = configs_by_name.get(needs_name)
+					if needed_cfg is not None:
+						selected_configs.add(needs_name)
+						configs_to_process.append(needed_cfg)
 
-					for needs_name in cfg.needs_configs.split(','):
-						if needs_name:
-							need_projects.add(needs_name)
-
-					config_list_chaged= True
-					config_list.append(cfg)
-				if not need_projects:
-					break
-				selected_config_list = config_list
-				continue
+			# Keep the selected projects in their original order
+			config_list = [cfg for cfg in all_config_list if cfg.name in selected_configs]
 
 			need_projects -= configs
 			if need_projects:
@@ -1871,7 +2282,7 @@ class project_config:
 			if config_list:
 				return config_list
 
-			if not project_nodes:
+			if not project_nodes_count:
 				fallback_config = project_config(default_cfg, xml_filename)
 				print('WARNING: XML config: No section <Project> present; using <Default> config')
 			elif fallback_config is None:
@@ -22,6 +22,8 @@ from pathlib import Path
 import shutil
 import json
 from types import SimpleNamespace
+from collections import Counter, deque
+import operator
 import git_repo
 import hashlib
 from exceptions import Exception_history_parse, Exception_cfg_parse
@@ -58,58 +60,172 @@ def get_directory_mapped_status(tree, unmapped_dir_list, prefix='/'):
 
 def find_tree_prefix(old_git_tree, new_tree, git_repo):
 	# Get filenames of git tree
-	old_tree_names = git_repo.ls_tree(old_git_tree, '-r', '--full-tree', '--name-only')
-	new_tree_names = [pathname for (pathname, obj) in new_tree]
-
-	# Now reverse the names and sort the combined list
-	# Names of the old tree will have the leading slash. They will sort after the similar names of the new tree,
-	# after path component reversal
-	reversed_old_list = ['/'.join((lambda l : (l.reverse(), l)[1])(name.split('/'))) + '/' for name in old_tree_names]
-	reversed_new_list = ['/'.join((lambda l : (l.reverse(), l)[1])(name.split('/'))) for name in new_tree_names]
-
-	combined_list = reversed_old_list + reversed_new_list
-	combined_list.sort()
-
-	ii = iter(combined_list)
-	prefixes = {}
-	prev_str = next(ii, None)
-	curr_str = next(ii, None)
-
-	while prev_str and curr_str:
-		if prev_str.endswith('/') or not curr_str.endswith('/'):
-			prev_str = curr_str
-			curr_str = next(ii, None)
-			continue
-		# We have two consecutive lines, previous without a trailing slash (name from new list),
-		# and current with a trailing slash (name from old list)
-		if curr_str.startswith(prev_str + '/'):
-			prefix = curr_str[len(prev_str):-1]
-			if prefix in prefixes:
-				prefixes[prefix] += 1
-			else:
-				prefixes[prefix] = 1
-		prev_str = next(ii, None)
-		curr_str = next(ii, None)
+	old_tree_names = git_repo.ls_tree_names(old_git_tree)
+	new_tree_names = set(pathname for (pathname, obj) in new_tree)
+
+	# For each name of the old tree, find its longest trailing part
+	# present in the new tree. The rest of the old name is a prefix candidate.
+	prefixes = Counter()
+	for name in old_tree_names:
+		pos = 0
+		while True:
+			tail = name[pos:]
+			if tail in new_tree_names:
+				prefixes[name[:pos]] += 1
+				break
+			pos = name.find('/', pos) + 1
+			if not pos:
+				break
 
 	# find out which prefix had the most occurrence
-	prefixes = list(prefixes.items())
 	if not prefixes:
 		return ''
 
-	prefixes.sort(key=lambda t : t[1], reverse=True)
-	prefix = prefixes[0][0].split('/')
-	# the prefix is currently reversed, with slashes and both sides
-	prefix.reverse()
-	return '/'.join(prefix)
+	return prefixes.most_common(1)[0][0]
+
+### find_renamed_dirs finds pairs of similar directories in added and deleted directory lists.
+# Returns a list of (old_path, new_path) tuples.
+# The files under the renamed directories are removed from added_files and deleted_files lists
+def find_renamed_dirs(added_dirs, deleted_dirs, added_files, deleted_files):
+	renamed_dirs = []
+	# Indexes of deleted_dirs items already matched to an added directory
+	matched_deleted = set()
+	for new_path, tree2 in added_dirs:
+		# Find similar tree in deleted_dirs
+		for i, (old_path, tree1) in enumerate(deleted_dirs):
+			if i in matched_deleted:
+				continue
+			if tree2.is_similar(tree1):
+				renamed_dirs.append((old_path, new_path))
+				matched_deleted.add(i)
+				break
+			continue
+		continue
+
+	if not renamed_dirs:
+		return renamed_dirs
+
+	# Drop the matched directories and the files under them, rebuilding each list once
+	deleted_dirs[:] = [t for i, t in enumerate(deleted_dirs) if i not in matched_deleted]
+	old_paths = tuple(old_path for old_path, new_path in renamed_dirs)
+	new_paths = tuple(new_path for old_path, new_path in renamed_dirs)
+	deleted_files[:] = [t for t in deleted_files if not t[0].startswith(old_paths)]
+	added_files[:] = [t for t in added_files if not t[0].startswith(new_paths)]
+	return renamed_dirs
+
+### find_renamed_files finds pairs of files with same data in added and deleted file lists.
+# Returns a list of (old_path, new_path) tuples. The renamed files are removed from the lists
+def find_renamed_files(added_files, deleted_files):
+	renamed_files = []
+	# Index the deleted files by data SHA1, keeping their order.
+	# Not considering renames of empty files
+	deleted_by_sha1 = {}
+	for t1 in deleted_files:
+		if t1[1].data:
+			deleted_by_sha1.setdefault(t1[1].data_sha1, deque()).append(t1)
+
+	if not deleted_by_sha1:
+		return renamed_files
+
+	not_renamed = []
+	renamed_paths = set()
+	for t2 in added_files:
+		new_path, file2 = t2
+		# Take the first deleted file with same data
+		same_files = deleted_by_sha1.get(file2.data_sha1)
+		if not same_files:
+			not_renamed.append(t2)
+			continue
+		old_path, file1 = same_files.popleft()
+		renamed_files.append((old_path, new_path))
+		renamed_paths.add(old_path)
+		continue
+
+	added_files[:] = not_renamed
+	deleted_files[:] = [t1 for t1 in deleted_files if t1[0] not in renamed_paths]
+	return renamed_files
 
+## dirs is a tuple of directory paths
 def path_in_dirs(dirs, path):
-	for directory in dirs:
-		if path.startswith(directory):
-			return True
-	return False
+	return path.startswith(dirs)
+
+### find_prev_path finds the object by the path (split to names) in prev_tree.
+# obj is the object found by the same path in tree, which is the next revision's tree.
+# As soon as both trees share a subtree, obj is returned without walking further down
+def find_prev_path(prev_tree, tree, names, obj):
+	for name in names:
+		if prev_tree is tree:
+			return obj
+		if not prev_tree.is_dir():
+			return None
+		item = prev_tree.dict.get(name)
+		if item is None:
+			return None
+		prev_tree = item.object
+
+		if tree is None:
+			continue
+		if tree.is_dir():
+			item = tree.dict.get(name)
+			tree = item.object if item is not None else None
+		else:
+			tree = None
+		continue
+
+	return prev_tree
 # branch_changed set to True if there is a meaningful change in the tree (outside of merged directories)
 
+### layered_dict is a copy-on-write dictionary for maps shared by successive revisions.
+# The base dictionary can be shared with other layered_dict objects, and is never modified.
+# Modifications go to the overlay dictionary. copy() only copies the overlay,
+# until it grows big enough to be combined into a new base.
+# Iteration order is same as of a plain dictionary with same modifications
+class layered_dict:
+	__slots__ = ('base', 'overlay')
+	MAX_OVERLAY_SIZE = 64
+
+	def __init__(self, base=None, overlay=None):
+		self.base = base if base is not None else {}
+		self.overlay = overlay if overlay is not None else {}
+		return
+
+	def copy(self):
+		if len(self.overlay) * 2 >= len(self.base) \
+				or len(self.overlay) >= layered_dict.MAX_OVERLAY_SIZE:
+			return layered_dict({**self.base, **self.overlay})
+		return layered_dict(self.base, self.overlay.copy())
+
+	def get(self, key, default=None):
+		if key in self.overlay:
+			return self.overlay[key]
+		return self.base.get(key, default)
+
+	def __setitem__(self, key, value):
+		self.overlay[key] = value
+		return
+
+	def values(self):
+		overlay = self.overlay
+		for key, value in self.base.items():
+			yield overlay.get(key, value)
+		for key, value in overlay.items():
+			if key not in self.base:
+				yield value
+		return
+
+### staged_item is an entry of the stagelist: path in the branch, object (None if deleted), and Git file mode
+class staged_item:
+	__slots__ = ('path', 'obj', 'mode')
+
+	def __init__(self, path, obj, mode):
+		self.path = path
+		self.obj = obj
+		self.mode = mode
+		return
+
 class author_props:
+	__slots__ = ('author', 'email')
+
 	def __init__(self, author, email):
 		self.author = author
 		self.email = email
@@ -121,11 +237,18 @@ class author_props:
 def log_to_paragraphs(log):
 	# Split log message to paragraphs
 	paragraphs = []
-	log = log.replace('\r\n', '\n')
+	if '\r' in log:
+		log = log.replace('\r\n', '\n')
 	if log.startswith('\n\n'):
 		paragraphs.append('')
 
 	log = log.strip('\n \t')
+	if '\n\n' not in log:
+		# Most messages are a single paragraph, already stripped
+		if log:
+			paragraphs.append(log)
+		return paragraphs
+
 	for paragraph in log.split('\n\n'):
 		paragraph = paragraph.rstrip(' \t').lstrip('\n')
 		if paragraph:
@@ -142,6 +265,9 @@ class revision_props:
 
 ### project_branch_rev keeps result for a processed revision
 class project_branch_rev(async_workitem):
+	# Strips refs/ or refs/heads/ prefix from a refname for Cherry-picked-from: line
+	cherry_pick_refname_prefix = re.compile('^refs/(?:heads/)?')
+
 	def __init__(self, branch:project_branch, prev_rev=None):
 		super().__init__(executor=branch.executor, futures_executor=branch.proj_tree.futures_executor)
 		self.rev = None
@@ -174,7 +300,7 @@ class project_branch_rev(async_workitem):
 		self.staging_base_rev = None
 		if prev_rev is None:
 			self.tree:git_tree = None
-			self.merged_revisions = {}
+			self.merged_revisions = layered_dict()
 			# self.mergeinfo keeps the combined effective svn:mergeinfo attribute of the revision
 			self.mergeinfo = mergeinfo()
 			# self.tree_mergeinfo keeps the svn:mergeinfo attributes of the directory items of the revision
@@ -184,7 +310,7 @@ class project_branch_rev(async_workitem):
 			self.tree:git_tree = prev_rev.tree
 			# merged_revisions is a map of merged revisions keyed by (branch, index_seq).
 			# It either refers to the previous revision's map,
-			# or a copy is made and modified
+			# or a copy is made and modified. layered_dict makes the copy cheap
 			# Its values are tuples (merged_revision, revision_merged_at)
 			self.merged_revisions = prev_rev.merged_revisions
 			# propagate previous mergeinfo and tree_mergeinfo
@@ -241,7 +367,7 @@ class project_branch_rev(async_workitem):
 			return '\n'.join(merge_msg)
 
 		# Sort by ascending revision number
-		self.cherry_pick_revs.sort(key=lambda rev_info : rev_info.rev)
+		self.cherry_pick_revs.sort(key=operator.attrgetter('rev'))
 		# Commit list without duplicates
 		cherry_pick_commits = {}
 		for rev_info in self.cherry_pick_revs:
@@ -262,7 +388,7 @@ class project_branch_rev(async_workitem):
 			self.change_id = change_id
 
 		for rev_info in cherry_pick_commits.values():
-			refname = re.sub('(?:^refs/(?:heads/)?)(.*)?', r'\1', rev_info.branch.refname)
+			refname = self.cherry_pick_refname_prefix.sub('', rev_info.branch.refname, 1)
 			if not refname:
 				refname = rev_info.branch.path
 
@@ -332,8 +458,14 @@ class project_branch_rev(async_workitem):
 			if not self.change_id:
 				h = hashlib.sha1()
 				h.update(self.tree.get_hash())
-				h.update(bytes('COMMIT\n%s %s\n%s'
-					% (str(props.author_info), props.date, "\n\n".join(props.log)), encoding='utf-8'))
+				# Hash 'COMMIT\n<author> <date>\n' and the paragraphs separated by blank lines,
+				# without joining the whole message to a single buffer
+				h.update(('COMMIT\n%s %s\n' % (props.author_info, props.date)).encode('utf-8'))
+				separator = b''
+				for paragraph in props.log:
+					h.update(separator)
+					h.update(paragraph.encode('utf-8'))
+					separator = b'\n\n'
 				self.change_id = h.hexdigest()
 
 			props.log.append('Change-Id: I' + self.change_id)
@@ -351,13 +483,8 @@ class project_branch_rev(async_workitem):
 			return
 
 		log = revision.log
-		if revision.author:
-			author_info = self.branch.proj_tree.map_author(revision.author)
-		else:
-			# git commit-tree barfs if author is not provided
-			author_info = author_props("(None)", "none@localhost")
-
-		date = str(revision.datetime)
+		author_info = self.branch.proj_tree.map_author(revision.author)
+		date = revision.date_str
 
 		for edit_msg in self.branch.edit_msg_list:
 			if edit_msg.revs and not rev_in_ranges(edit_msg.revs, self.rev):
@@ -389,7 +516,8 @@ class project_branch_rev(async_workitem):
 		deleted_dirs = []
 		# staged_tree could be None. Invoke the comparison in reverse order,
 		# and swap the result
-		for t in self.tree.compare(base_tree):
+		# Child branch directories are skipped
+		for t in self.tree.compare(base_tree, prune_dirs=self.branch.ignore_dirs):
 			path = t[0]
 			obj2 = t[1]
 			obj1 = t[2]
@@ -431,41 +559,8 @@ class project_branch_rev(async_workitem):
 				changed_files.append(path)
 			continue
 
-		# Find renamed directories
-		renamed_dirs = []
-		for new_path, tree2 in added_dirs:
-			# Find similar tree in deleted_dirs
-			for t in deleted_dirs:
-				old_path, tree1 = t
-				metrics = tree2.get_difference_metrics(tree1)
-				if metrics.added + metrics.deleted < metrics.identical + metrics.different:
-					renamed_dirs.append((old_path, new_path))
-					deleted_dirs.remove(t)
-					for t in deleted_files.copy():
-						if t[0].startswith(old_path):
-							deleted_files.remove(t)
-					for t in added_files.copy():
-						if t[0].startswith(new_path):
-							added_files.remove(t)
-					break
-				continue
-			continue
-
-		# Find renamed files
-		renamed_files = []
-		for t2 in added_files.copy():
-			# Find similar tree in deleted_dirs
-			new_path, file2 = t2
-			for t1 in deleted_files:
-				old_path, file1 = t1
-				# Not considering renames of empty files
-				if file1.data and file1.data_sha1 == file2.data_sha1:
-					renamed_files.append((old_path, new_path))
-					added_files.remove(t2)
-					deleted_files.remove(t1)
-					break
-				continue
-			continue
+		renamed_dirs = find_renamed_dirs(added_dirs, deleted_dirs, added_files, deleted_files)
+		renamed_files = find_renamed_files(added_files, deleted_files)
 
 		title = ''
 		long_title = ''
@@ -653,48 +748,47 @@ class project_branch_rev(async_workitem):
 
 		# Process all copy sources. Mergeinfo they bring needs to be added to the previous mergeinfo
 		if self.copy_sources is not None:
-			for dest_path, rev_dict in self.copy_sources.items():
+			for (dest_path, source_path), rev in self.copy_sources.items():
 				# dest_path for a directory here ends with '/'
 				new_path_prefix = dest_path.removeprefix(branch.path)
-				for source_path, rev in rev_dict.items():
-					# source_path for a directory here ends with '/'
-					# The copy source may be outside of any mapped branch, but should be present in the root tree
-					# The copy source revision and path are previously verified to be valid and
-					# map to a present path
-					prev_path_prefix = source_path
-					source_rev = proj_tree.find_branch_rev(source_path, rev)
-					if source_rev is None:
-						source_obj = proj_tree.get_revision(rev).tree
-						source_tree_mergeinfo = tree_mergeinfo()
-						source_tree_mergeinfo.load_tree(source_obj, source_path, recurse_tree=True)
-						prev_path_prefix = ''
-					elif source_rev.branch.path == source_path:
-						# The copy source is the whole branch
-						prev_path_prefix = ''
-						source_tree_mergeinfo = source_rev.tree_mergeinfo
-					else:
-						# The copy source is a subdirectory or a file in branch
-						# This mergeinfo has full paths as keys
-						prev_path_prefix = source_path.removeprefix(source_rev.branch.path)
-						source_tree_mergeinfo = tree_mergeinfo()
-						source_tree_mergeinfo.get_subtree_mergeinfo(source_rev.tree_mergeinfo, prev_path_prefix)
-						prev_path_prefix = ''
-
-					if not source_tree_mergeinfo:
-						# empty
-						continue
-					if source_tree_mergeinfo is prev_rev.tree_mergeinfo:
-						continue
-
-					if prev_tree_mergeinfo is prev_rev.tree_mergeinfo:
-						prev_tree_mergeinfo = prev_tree_mergeinfo.copy()
-					# prev_path_prefix must be the source branch path to be removed from source_tree_mergeinfo
-					if prev_tree_mergeinfo.add_tree_mergeinfo(source_tree_mergeinfo, prev_path_prefix, new_path_prefix) \
-						and proj_tree.log_merges_verbose:
-							print(" SUB mergeinfo:prev_prefix=%s,new_prefix=%s\n%s" %
-								(prev_path_prefix, new_path_prefix, str(source_tree_mergeinfo)), file=self.log_file)
+				# source_path for a directory here ends with '/'
+				# The copy source may be outside of any mapped branch, but should be present in the root tree
+				# The copy source revision and path are previously verified to be valid and
+				# map to a present path
+				prev_path_prefix = source_path
+				source_rev = proj_tree.find_branch_rev(source_path, rev)
+				if source_rev is None:
+					source_obj = proj_tree.get_revision(rev).tree
+					source_tree_mergeinfo = tree_mergeinfo()
+					source_tree_mergeinfo.load_tree(source_obj, source_path, recurse_tree=True)
+					prev_path_prefix = ''
+				elif source_rev.branch.path == source_path:
+					# The copy source is the whole branch
+					prev_path_prefix = ''
+					source_tree_mergeinfo = source_rev.tree_mergeinfo
+				else:
+					# The copy source is a subdirectory or a file in branch
+					# This mergeinfo has full paths as keys
+					prev_path_prefix = source_path.removeprefix(source_rev.branch.path)
+					source_tree_mergeinfo = tree_mergeinfo()
+					source_tree_mergeinfo.get_subtree_mergeinfo(source_rev.tree_mergeinfo, prev_path_prefix)
+					prev_path_prefix = ''
+
+				if not source_tree_mergeinfo:
+					# empty
+					continue
+				if source_tree_mergeinfo is prev_rev.tree_mergeinfo:
 					continue
 
+				if prev_tree_mergeinfo is prev_rev.tree_mergeinfo:
+					prev_tree_mergeinfo = prev_tree_mergeinfo.copy()
+				# prev_path_prefix must be the source branch path to be removed from source_tree_mergeinfo
+				if prev_tree_mergeinfo.add_tree_mergeinfo(source_tree_mergeinfo, prev_path_prefix, new_path_prefix) \
+					and proj_tree.log_merges_verbose:
+						print(" SUB mergeinfo:prev_prefix=%s,new_prefix=%s\n%s" %
+							(prev_path_prefix, new_path_prefix, str(source_tree_mergeinfo)), file=self.log_file)
+				continue
+
 		# See if the mergeinfo dictionary has been changed from the previous revision
 		if self.tree_mergeinfo is prev_tree_mergeinfo:
 			return
@@ -704,12 +798,23 @@ class project_branch_rev(async_workitem):
 
 		if prev_tree_mergeinfo is prev_rev.tree_mergeinfo:
 			prev_mergeinfo = prev_rev.mergeinfo
+			# prev_rev.mergeinfo must not be modified
+			built_prev_mergeinfo = None
 		else:
 			prev_mergeinfo = prev_tree_mergeinfo.build_mergeinfo()
+			built_prev_mergeinfo = prev_mergeinfo
 
-		# Newly added merged revisions may bring other merged revisions, which needs to be subtracted
+		# Branches of the mergeinfo paths. Each path is only looked up once
+		# for all passes over mergeinfo_diff
+		merged_branches = {}
+
+		# Newly added merged revisions may bring other merged revisions, which needs to be subtracted.
+		# Once built, prev_mergeinfo is updated along with prev_tree_mergeinfo
 		while True:
 			mergeinfo_diff = self.mergeinfo.get_diff(prev_mergeinfo)
+			for path in mergeinfo_diff.paths_dict:
+				if path not in merged_branches:
+					merged_branches[path] = proj_tree.find_branch(path)
 			if proj_tree.log_merges_verbose and mergeinfo_diff:
 				if prev_tree_mergeinfo is not prev_rev.tree_mergeinfo:
 					if prev_mergeinfo:
@@ -721,11 +826,12 @@ class project_branch_rev(async_workitem):
 				print("MERGEINFO DIFF:\n\t%s" % mergeinfo_diff.__str__('\t'), file=self.log_file)
 
 			for path, added_ranges in mergeinfo_diff.items():
-				merged_branch = proj_tree.find_branch(path)
+				merged_branch = merged_branches[path]
 				if not merged_branch:
 					new_tree_mergeinfo = proj_tree.find_tree_mergeinfo(path,
 												added_ranges[-1][1],inherit=True, recurse_tree=True)
-					if prev_tree_mergeinfo.add_tree_mergeinfo(new_tree_mergeinfo):
+					if prev_tree_mergeinfo.add_tree_mergeinfo(new_tree_mergeinfo,
+											built_mergeinfo=built_prev_mergeinfo):
 						mergeinfo_diff = None
 					continue
 				path = path.lstrip('/')
@@ -739,7 +845,8 @@ class project_branch_rev(async_workitem):
 				if prev_tree_mergeinfo is prev_rev.tree_mergeinfo:
 					prev_tree_mergeinfo = prev_tree_mergeinfo.copy()
 				#original_tree_mergeinfo = prev_tree_mergeinfo.copy()
-				if prev_tree_mergeinfo.add_tree_mergeinfo(rev_to_merge.tree_mergeinfo):
+				if prev_tree_mergeinfo.add_tree_mergeinfo(rev_to_merge.tree_mergeinfo,
+											built_mergeinfo=built_prev_mergeinfo):
 					mergeinfo_diff = None
 					if proj_tree.log_merges_verbose:
 						print("\nSUB MERGEINFO from %s;%d:\n%s"
@@ -748,7 +855,9 @@ class project_branch_rev(async_workitem):
 			if mergeinfo_diff is not None:
 				break
 			# Give it another spin
-			prev_mergeinfo = prev_tree_mergeinfo.build_mergeinfo()
+			if built_prev_mergeinfo is None:
+				built_prev_mergeinfo = prev_tree_mergeinfo.build_mergeinfo()
+			prev_mergeinfo = built_prev_mergeinfo
 			continue
 
 		self.merge_from_dict = {}
@@ -756,7 +865,7 @@ class project_branch_rev(async_workitem):
 		mergeinfo_diff.normalize()
 		for path, added_ranges in mergeinfo_diff.items():
 
-			merged_branch = proj_tree.find_branch(path)
+			merged_branch = merged_branches[path]
 			if merged_branch is None:
 				rev_to_merge = proj_tree.get_revision(added_ranges[-1][1])
 				obj = rev_to_merge.tree.find_path(path)
@@ -769,7 +878,7 @@ class project_branch_rev(async_workitem):
 				make_cherry_pick_revs = True
 				path = path.lstrip('/')
 				rev_to_merge = merged_branch.get_revision(added_ranges[-1][1])
-				if path == merged_branch.path.removesuffix('/'):
+				if path == merged_branch.path_no_slash:
 					path = ''
 					recreate_merge = branch.recreate_merges.branch_merge
 				else:
@@ -813,6 +922,7 @@ class project_branch_rev(async_workitem):
 			# Filter revisions by the path
 			filtered_ranges = []
 			cherry_pick_revs = []
+			path_names = [name for name in path.split('/') if name]
 			while added_ranges:
 
 				# walk the revisions back
@@ -829,7 +939,7 @@ class project_branch_rev(async_workitem):
 					if prev_rev is None or prev_rev.tree is None:
 						break
 
-					prev_obj = prev_rev.tree.find_path(path)
+					prev_obj = find_prev_path(prev_rev.tree, rev_to_merge.tree, path_names, obj)
 
 					if rev <= end:
 						if prev_obj is not obj:
@@ -971,6 +1081,13 @@ class project_branch_rev(async_workitem):
 		(merged_rev, merged_at_rev) = self.merged_revisions.get((rev_info_or_branch, index_seq), (None,None))
 		return merged_rev
 
+	### Same as get_merged_revision() for a project_branch_rev argument, without the type check
+	def get_merged_revision_of(self, rev_info):
+		merged = self.merged_revisions.get((rev_info.branch, rev_info.index_seq))
+		if merged is None:
+			return None
+		return merged[0]
+
 	def set_merged_revision(self, merged_rev, merged_at_rev=None):
 		if merged_at_rev is None:
 			merged_at_rev = self
@@ -1019,7 +1136,7 @@ class project_branch_rev(async_workitem):
 		# Find those branches in self+self.merged_revisions, these will be start of unmerged revision ranges.
 		unmerged_ranges = []
 		rev_to_merge = rev_to_merge.walk_back_empty_revs()
-		merged_rev = self.get_merged_revision(rev_to_merge)
+		merged_rev = self.get_merged_revision_of(rev_to_merge)
 		if merged_rev is not None \
 			and merged_rev.rev >= rev_to_merge.rev:
 			return unmerged_ranges
@@ -1030,7 +1147,7 @@ class project_branch_rev(async_workitem):
 			if rev_info.branch is self.branch and rev_info.index_seq == self.index_seq:
 				continue
 
-			merged_rev = self.get_merged_revision(rev_info)
+			merged_rev = self.get_merged_revision_of(rev_info)
 			if merged_rev is not None \
 				and merged_rev.rev >= rev_info.rev:
 				continue
@@ -1060,9 +1177,11 @@ class project_branch_rev(async_workitem):
 			# is considered merged
 			return True
 
-		merged_rev = self.get_merged_revision(branch, index_seq)
-		if merged_rev is None:
+		# branch is already resolved, look up the map directly
+		merged = self.merged_revisions.get((branch, index_seq))
+		if merged is None:
 			return False
+		merged_rev = merged[0]
 		if skip_empty_revs:
 			rev_info = rev_info.walk_back_empty_revs()
 
@@ -1089,10 +1208,11 @@ class project_branch_rev(async_workitem):
 
 		if self.copy_sources is None:
 			self.copy_sources = {}
-		copy_sources = self.copy_sources.setdefault(target_path, {})
-		rev = copy_sources.setdefault(source_path, copy_rev)
-		if rev < copy_rev:
-			copy_sources[source_path] = copy_rev
+		# copy_sources is keyed by (target_path, source_path); the highest copy revision is kept
+		key = (target_path, source_path)
+		rev = self.copy_sources.get(key)
+		if rev is None or rev < copy_rev:
+			self.copy_sources[key] = copy_rev
 		return
 
 	## Adds a parent branch, which will serve as the commit's parent.
@@ -1119,8 +1239,7 @@ class project_branch_rev(async_workitem):
 		if source is None:
 			return False
 
-		metrics = self.tree.get_difference_metrics(source)
-		return metrics.added + metrics.deleted < metrics.identical + metrics.different
+		return self.tree.is_similar(source)
 
 	def mark_need_commit(self):
 		if self.need_commit:
@@ -1131,12 +1250,17 @@ class project_branch_rev(async_workitem):
 		# 1. It has its own changes outside child branches (self.changes_present)
 		# 2. Or it's used as a non-child-branch merge parent, and it has merge parents
 		# 3. Or it merges child branches, and the next commit has its own changes.
-		# If a commit is marked as needed, its merge parents also marked as needed
-		self.need_commit = True
-		for rev_info in self.parents[1:]:
-			rev_info.mark_need_commit()
-		for rev_info in self.merge_children:
-			rev_info.mark_need_commit()
+		# If a commit is marked as needed, its merge parents also marked as needed.
+		# The merge parents are walked with a work list, instead of recursion
+		work_list = [self]
+		while work_list:
+			rev_info = work_list.pop()
+			if rev_info.need_commit:
+				continue
+			rev_info.need_commit = True
+			work_list += rev_info.parents[1:]
+			work_list += rev_info.merge_children
+			continue
 		return
 
 	### This function is used to gather a list of merged revisions.
@@ -1232,7 +1356,7 @@ class project_branch_rev(async_workitem):
 				self.mergeinfo.add_mergeinfo(new_prev_rev.mergeinfo)
 				self.tree_mergeinfo.add_tree_mergeinfo(new_prev_rev.tree_mergeinfo)
 				if self.copy_sources:
-					self.copy_sources.get(branch.path, {}).pop(new_prev_rev.branch.path, None)
+					self.copy_sources.pop((branch.path, new_prev_rev.branch.path), None)
 				prev_rev = new_prev_rev
 
 		self.staging_base_rev = prev_rev
@@ -1247,7 +1371,8 @@ class project_branch_rev(async_workitem):
 			new_tree = branch.proj_tree.empty_tree
 
 		difflist = []
-		for t in old_tree.compare(new_tree, path_prefix, expand_dir_contents=True):
+		for t in old_tree.compare(new_tree, path_prefix, expand_dir_contents=True,
+								prune_dirs=branch.ignore_dirs):
 			path = t[0]
 			obj1 = t[1]
 			obj2 = t[2]
@@ -1299,10 +1424,10 @@ class project_branch_rev(async_workitem):
 		# Check if the path is one of the injected files
 		injected_file = branch.inject_files.get(path)
 		if injected_file:
-			post_staged_list.append(SimpleNamespace(path=path, obj=injected_file,
-										mode=branch.get_file_mode(path, injected_file)))
+			post_staged_list.append(staged_item(path, injected_file,
+										branch.get_file_mode(path, injected_file)))
 
-		stagelist.append(SimpleNamespace(path=path, obj=None, mode=0))
+		stagelist.append(staged_item(path, None, 0))
 
 		# count staged files
 		self.files_staged -= 1
@@ -1438,7 +1563,7 @@ class project_branch_rev(async_workitem):
 				# a path is created or replaced. This commit has to be forced out
 				self.changes_present = True
 
-			stagelist.append(SimpleNamespace(path=path, obj=obj2, mode=mode))
+			stagelist.append(staged_item(path, obj2, mode))
 			continue
 
 		return
@@ -1462,12 +1587,12 @@ class project_branch_rev(async_workitem):
 			if HEAD.files_staged:
 				# delete injected files, too
 				for path in branch.inject_files:
-					stagelist.insert(0, SimpleNamespace(path=path, obj=None, mode=0))
+					stagelist.insert(0, staged_item(path, None, 0))
 		elif HEAD.files_staged == 0:
 			# old tree was empty, new tree is not empty. Inject files:
 			for (path, obj2) in branch.inject_files.items():
-				stagelist.insert(0, SimpleNamespace(path=path, obj=obj2,
-										mode=branch.get_file_mode(path, obj2)))
+				stagelist.insert(0, staged_item(path, obj2,
+										branch.get_file_mode(path, obj2)))
 		else:
 			stagelist += post_staged_list
 
@@ -1504,15 +1629,15 @@ class project_branch_rev(async_workitem):
 				fmt = obj.fmt
 				data = obj.pretty_data
 
-			h = hashlib.sha1()
-			h.update(obj.get_hash())
+			h = hashlib.sha1(obj.get_hash())
 			h.update(branch.gitattributes_sha1)
 			if obj.fmt is not None:
 				h.update(format_files.sha1)
 				h.update(obj.fmt.get_format_tag())
 			h.update(item.path.encode())
 
-			sha1 = h.hexdigest()
+			# The maps are keyed by binary digest; the sha1 map file keeps hex strings
+			sha1 = h.digest()
 			git_sha1 = branch.proj_tree.sha1_map.get(sha1, None)
 			if git_sha1 is not None:
 				obj.git_sha1 = git_sha1
@@ -1579,10 +1704,15 @@ class project_branch_rev(async_workitem):
 
 ## project_branch - keeps a context for a single change branch (or tag) of a project
 class project_branch(dependency_node):
+	IGNORE_FILE_CACHE_SIZE = 0x10000
+	CHMOD_CACHE_SIZE = 0x10000
+	FORMAT_SPECIFICATION_CACHE_SIZE = 0x10000
 
 	def __init__(self, proj_tree:project_history_tree, branch_map, workdir:Path, parent_branch):
 		super().__init__(executor=proj_tree.executor)
 		self.path = branch_map.path
+		# Branch path without the trailing slash, to match mergeinfo paths
+		self.path_no_slash = self.path.removesuffix('/')
 		self.proj_tree = proj_tree
 		# Matching project's config
 		self.cfg:project_config.project_config = branch_map.cfg
@@ -1596,12 +1726,13 @@ class project_branch(dependency_node):
 		self.add_tree_prefix = branch_map.add_tree_prefix
 
 		# ignore_dirs are paths of non-merging child branch dirs, with trailing slash
-		# files in those directories are ignored in the change list
-		self.ignore_dirs = []
+		# files in those directories are ignored in the change list.
+		# It's a tuple, to be used directly with str.startswith()
+		self.ignore_dirs = ()
 		self.parent = parent_branch
 		# child_merge_dirs are directories of merged child branches.
 		# Changes in those directories are staged, but don't trigger a commit
-		self.child_merge_dirs = []
+		self.child_merge_dirs = ()
 		self.merge_parent = None
 		# Not blocking commits on this branch, until it has merged children added
 		self.block_commits = None
@@ -1613,7 +1744,7 @@ class project_branch(dependency_node):
 				self.lazy_merge_to_parent = branch_map.lazy_merge_to_parent
 				# These directories are only ignored for the purpose of
 				# deciding to force make a commit.
-				parent_branch.child_merge_dirs.append(relative_path)
+				parent_branch.child_merge_dirs += (relative_path,)
 				if self.lazy_merge_to_parent:
 					# A regular branch doesn't block its commits
 					# Only if lazily merged branches are added, the HEAD will get marked as depending on this branch,
@@ -1623,7 +1754,7 @@ class project_branch(dependency_node):
 					parent_branch.block_commits.ready()
 			else:
 				# If not merging to the parent branch, add ignore specifications.
-				parent_branch.ignore_dirs.append(relative_path)
+				parent_branch.ignore_dirs += (relative_path,)
 
 		self.revisions = []
 		self.orphan_parent = None
@@ -1647,6 +1778,12 @@ class project_branch(dependency_node):
 			continue
 
 		self.ignore_files = branch_map.ignore_files
+		# Results of ignore_file() by relative path. The ignore specifications never change
+		self.ignore_file_cache = {}
+		# File modes set by chmod specifications, by relative path. 0 if no specification matches
+		self.chmod_cache = {}
+		# Format specifications found by find_format_specification(), by path
+		self.format_specification_cache = {}
 		self.format_specifications = branch_map.format_specifications
 		self.skip_commit_list = branch_map.skip_commit_list + branch_map.cfg.skip_commit_list
 
@@ -1667,6 +1804,9 @@ class project_branch(dependency_node):
 		# Null tree SHA1
 		self.initial_git_tree = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
 		self.gitattributes_sha1 = None
+		# Hash of .gitattributes files in a working directory made by make_gitattributes_tree(),
+		# if it has no other files
+		self.gitattributes_workdir_sha1 = None
 
 		# Full ref name for Git branch or tag for this branch
 		self.refname = branch_map.refname
@@ -1728,29 +1868,44 @@ class project_branch(dependency_node):
 		if self.git_index_directory is None:
 			return
 
-		if prev_tree is not self.proj_tree.empty_tree:
-			self.workdir_seq += 1
-			self.git_env = self.make_git_env()
-
 		h = hashlib.sha1()
 
-		# Check out all .gitattributes files from the injected list and the tree
+		# Find all .gitattributes files in the injected list and the tree
+		gitattributes_files = []
 		for path, obj in *self.inject_files.items(), *tree:
 			if not obj.is_file() or not path.endswith('.gitattributes'):
 				continue
 			# Strip the filename
 			directory = path[0:-len('.gitattributes')]
-			if not directory:
-				pass
-			elif directory.endswith('/'):
-				Path.mkdir(self.git_working_directory.joinpath(directory), parents=True, exist_ok = True)
-			else:
+			if directory and not directory.endswith('/'):
 				continue
-			self.git_working_directory.joinpath(path).write_bytes(obj.pretty_data)
+			gitattributes_files.append((directory, path, obj))
 			h.update(b"%s\t%b" % (path.encode(), obj.data_sha1))
 			continue
 
-		self.gitattributes_sha1 = h.digest()
+		gitattributes_sha1 = h.digest()
+		if gitattributes_sha1 == self.gitattributes_workdir_sha1:
+			# The current working directory already has exactly these files
+			self.gitattributes_sha1 = gitattributes_sha1
+			return
+
+		if prev_tree is not self.proj_tree.empty_tree:
+			self.workdir_seq += 1
+			self.git_env = self.make_git_env()
+			# The new directory only has the files written below
+			self.gitattributes_workdir_sha1 = gitattributes_sha1
+		else:
+			# The directory can keep files written before
+			self.gitattributes_workdir_sha1 = None
+
+		# Check out the .gitattributes files
+		for directory, path, obj in gitattributes_files:
+			if directory:
+				Path.mkdir(self.git_working_directory.joinpath(directory), parents=True, exist_ok = True)
+			self.git_working_directory.joinpath(path).write_bytes(obj.pretty_data)
+			continue
+
+		self.gitattributes_sha1 = gitattributes_sha1
 		return
 
 	## Adds a parent branch, which will serve as the commit's parent.
@@ -1883,7 +2038,8 @@ class project_branch(dependency_node):
 	def finalize_commit(self, rev_info):
 		git_repo = self.git_repo
 
-		parent_commits = []
+		# Parent commit IDs in order, without duplicates. The dictionary values are not used
+		parent_commits = {}
 		parent_git_tree = self.initial_git_tree
 		prev_git_tree = self.initial_git_tree
 		parent_tree = None
@@ -1894,7 +2050,7 @@ class project_branch(dependency_node):
 			parent_rev = rev_info.parents[1]
 			if parent_rev.committed_git_tree == rev_info.staged_git_tree and parent_rev.committed_git_tree != self.initial_git_tree:
 				# Check if the first parent commit is a direct ancestor of this
-				merged_to_parent_rev = parent_rev.get_merged_revision(rev_info)
+				merged_to_parent_rev = parent_rev.get_merged_revision_of(rev_info)
 				if merged_to_parent_rev is not None and \
 					merged_to_parent_rev.walk_back_empty_revs() is rev_info.parents[0].walk_back_empty_revs():
 					print("FAST FORWARD: Merge of %s;r%s to %s;r%s"
@@ -1913,7 +2069,7 @@ class project_branch(dependency_node):
 						need_commit = True
 				continue
 			if parent_rev.commit not in parent_commits:
-				parent_commits.append(parent_rev.commit)
+				parent_commits[parent_rev.commit] = None
 				if base_rev is None or base_rev.committed_git_tree == self.initial_git_tree:
 					base_rev = parent_rev
 
@@ -1927,7 +2083,7 @@ class project_branch(dependency_node):
 			for merge_rev in rev_info.merge_children:
 				if merge_rev.commit and merge_rev.commit not in parent_commits:
 					rev_info.parents.append(merge_rev)
-					parent_commits.append(merge_rev.commit)
+					parent_commits[merge_rev.commit] = None
 
 		# If the tree haven't changed, don't push the commit.
 		# changes_present might have been set because the previous index was empty
@@ -1971,15 +2127,14 @@ class project_branch(dependency_node):
 			self.proj_tree.commits_to_make -= 1
 			# Not making a commit yet, carry things over to the next
 			next_rev = rev_info.next_rev
+			# Branches of child revisions already merged by the next revision
+			next_merge_branches = set(merge_child_next_rev.branch for merge_child_next_rev in next_rev.merge_children)
 			for merge_child_rev in rev_info.merge_children:
-				for merge_child_next_rev in next_rev.merge_children:
-					if merge_child_next_rev.branch == merge_child_rev.branch:
-						# The next revision merges this child branch
-						break
-				else:
+				if merge_child_rev.branch not in next_merge_branches:
 					# The next revision doesn't merge this child branch
 					# FIXME: check revisions
 					next_rev.merge_children.append(merge_child_rev)
+					next_merge_branches.add(merge_child_rev.branch)
 				if rev_info.need_commit:
 					next_rev.need_commit = True
 
@@ -2016,16 +2171,20 @@ class project_branch(dependency_node):
 		pipe = git_process.stdin
 		path_prefix = self.tree_prefix
 
+		# The index info lines are collected and written to the pipe at once
+		lines = []
 		for item in stagelist:
 			if path_prefix:
 				item.path = path_prefix + item.path
 			if item.obj is None:
 				# a path is deleted
-				pipe.write(b"000000 0000000000000000000000000000000000000000 0\t%s\n" % bytes(item.path, encoding='utf-8'))
+				lines.append(b"000000 0000000000000000000000000000000000000000 0\t%s\n" % item.path.encode('utf-8'))
 				continue
 			# a path is created or replaced
-			pipe.write(b"%06o %s 0\t%s\n" % (item.mode, bytes(item.obj.get_git_sha1(), encoding='utf-8'), bytes(item.path, encoding='utf-8')))
+			lines.append(b"%06o %s 0\t%s\n" % (item.mode, item.obj.get_git_sha1().encode('utf-8'), item.path.encode('utf-8')))
+			continue
 
+		pipe.write(b''.join(lines))
 		pipe.close()
 		git_process.wait()
 
@@ -2038,18 +2197,39 @@ class project_branch(dependency_node):
 		if obj.is_symlink():
 			return 0o120000
 
-		for (match_list, mode) in self.cfg.chmod_specifications:
-			if match_list.match(path):
-				return 0o100000|mode
+		if self.cfg.chmod_specifications:
+			chmod_mode = self.chmod_cache.get(path)
+			if chmod_mode is None:
+				chmod_mode = 0
+				for (match_list, mode) in self.cfg.chmod_specifications:
+					if match_list.match(path):
+						chmod_mode = 0o100000|mode
+						break
+
+				if len(self.chmod_cache) >= project_branch.CHMOD_CACHE_SIZE:
+					self.chmod_cache.clear()
+				self.chmod_cache[path] = chmod_mode
+
+			if chmod_mode:
+				return chmod_mode
 
 		if obj.svn_executable is not None:
 			return 0o100755
 		return 0o100644
 
 	def ignore_file(self, path):
+		# fullmatch() result can be True (ignore), False (negated pattern matched) or None (no match).
+		# All of them are cached
+		if path in self.ignore_file_cache:
+			return self.ignore_file_cache[path]
+
 		ignore = self.ignore_files.fullmatch(path)
 		if ignore is None:
 			ignore = self.cfg.ignore_files.fullmatch(self.path + path)
+
+		if len(self.ignore_file_cache) >= project_branch.IGNORE_FILE_CACHE_SIZE:
+			self.ignore_file_cache.clear()
+		self.ignore_file_cache[path] = ignore
 		return ignore
 
 	def hash_object(self, data, path, sha1, fmt, git_env, log_file):
@@ -2068,25 +2248,12 @@ class project_branch(dependency_node):
 		self.proj_tree.sha1_map[sha1] = git_sha1
 		return git_sha1
 
-	def preprocess_blob_object(self, obj, node_path):
+	### find_format_specification() returns the format specification for the file, or None.
+	# path is relative to the branch root, node_path is relative to the source root
+	def find_format_specification(self, path, node_path):
 		proj_tree = self.proj_tree
 		log_file = proj_tree.log_file
-		# Cut off the branch path to make relative paths
-		path = node_path.removeprefix(self.path)
-
-		if self.ignore_file(path):
-			if proj_tree.git_repo is None and proj_tree.options.log_dump:
-				print('IGNORED: File %s' % (node_path), file=log_file)
-				# With git repository, IGNORED files are printed during staging
-			return obj
 
-		if obj.is_symlink():
-			return obj
-
-		if getattr(proj_tree.options, 'replace_svn_keywords', False):
-			obj = obj.expand_keywords(proj_tree.HEAD(), node_path)
-
-		# path is relative to the branch root
 		for fmt in self.format_specifications:
 			match = fmt.paths.fullmatch(path)
 
@@ -2133,6 +2300,38 @@ class project_branch(dependency_node):
 			else:
 				fmt = None
 
+		return fmt
+
+	def preprocess_blob_object(self, obj, node_path):
+		proj_tree = self.proj_tree
+		log_file = proj_tree.log_file
+		# Cut off the branch path to make relative paths
+		path = node_path.removeprefix(self.path)
+
+		if self.ignore_file(path):
+			if proj_tree.git_repo is None and proj_tree.options.log_dump:
+				print('IGNORED: File %s' % (node_path), file=log_file)
+				# With git repository, IGNORED files are printed during staging
+			return obj
+
+		if obj.is_symlink():
+			return obj
+
+		if getattr(proj_tree.options, 'replace_svn_keywords', False):
+			obj = obj.expand_keywords(proj_tree.HEAD(), node_path)
+
+		# path is relative to the branch root
+		if proj_tree.log_formatting:
+			# The matching is logged for every file
+			fmt = self.find_format_specification(path, node_path)
+		else:
+			fmt = self.format_specification_cache.get(node_path, False)
+			if fmt is False:
+				fmt = self.find_format_specification(path, node_path)
+				if len(self.format_specification_cache) >= project_branch.FORMAT_SPECIFICATION_CACHE_SIZE:
+					self.format_specification_cache.clear()
+				self.format_specification_cache[node_path] = fmt
+
 		if fmt is not None:
 			if obj.git_attributes.get('formatting') != fmt.format_tag:
 				obj = obj.make_unshared()
@@ -2461,6 +2660,7 @@ class log_serializer(dependency_node):
 class project_history_tree(history_reader):
 	BLOB_TYPE = git_blob
 	TREE_TYPE = git_tree
+	FIND_BRANCH_CACHE_SIZE = 0x10000
 
 	def __init__(self, options=None):
 		super().__init__(options)
@@ -2476,6 +2676,8 @@ class project_history_tree(history_reader):
 
 		# This is a tree of branches
 		self.branches = path_tree()
+		# find_branch() results, keyed by (path, match_full_path). Cleared when a branch is added
+		self.find_branch_cache = {}
 		self.mapped_dirs = path_tree()
 		# class path_tree iterates in the tree recursion order: from root to branches
 		# branches_list will iterate in order in which the branches are created
@@ -2485,6 +2687,8 @@ class project_history_tree(history_reader):
 		# This path tree is used to detect refname collisions, when a new branch
 		# is created with an already existing ref
 		self.all_refs = path_tree()
+		# Next '___N' suffix to try in make_unique_refname, keyed by the original refname
+		self.refname_next_suffix = {}
 		self.prev_sha1_map = {}
 		self.sha1_map = {}
 		self.deleted_revs = []
@@ -2493,6 +2697,7 @@ class project_history_tree(history_reader):
 		# Missing names are also added to the dictionary as <name>@localhost
 		self.authors_map = {}
 		self.unmapped_authors = []
+		self.no_author_info = author_props("(None)", "none@localhost")
 		self.append_to_refs = {}
 		self.prune_refs = {}
 		# This is list of project configurations in order of their declaration
@@ -2654,7 +2859,17 @@ class project_history_tree(history_reader):
 	# @param path - the path to find a branch.
 	#  The target branch path will be a prefix of 'path'
 	def find_branch(self, path, match_full_path=False):
-		return self.branches.find_path(path, match_full_path)
+		key = (path, match_full_path)
+		# None is a valid cached result
+		branch = self.find_branch_cache.get(key, False)
+		if branch is not False:
+			return branch
+
+		branch = self.branches.find_path(path, match_full_path)
+		if len(self.find_branch_cache) >= project_history_tree.FIND_BRANCH_CACHE_SIZE:
+			self.find_branch_cache.clear()
+		self.find_branch_cache[key] = branch
+		return branch
 
 	def all_branches(self) -> Iterator[project_branch]:
 		return (node.object for node in self.branches if node.object is not None)
@@ -2735,6 +2950,7 @@ class project_history_tree(history_reader):
 
 		self.branches.set(branch_map.path, branch)
 		self.branches.set_mapped(branch_map.path, True)
+		self.find_branch_cache.clear()
 		self.branches_list.append(branch)
 		self.mapped_dirs.set_mapped(branch_map.path, True)
 
@@ -2750,14 +2966,19 @@ class project_history_tree(history_reader):
 		# c) The non-terminal path element conflicts with an existing terminal tree element (leaf). Impossible to resolve
 
 		# For terminal elements, leaf if set to the 
-		for i in range(1, 100):
+		# Refs are never removed from all_refs, so the probing resumes
+		# from the suffix after the one last assigned for this refname
+		suffix = self.refname_next_suffix.get(refname, 0)
+		if suffix:
+			new_ref = refname + '___%d' % suffix
+		for i in range(suffix + 1, 100):
 			node = self.all_refs.get_node(new_ref, match_full_path=True)
 			if node is None:
 				# Full path doesn't match, but partial path may exist
 				break
 			# Full path matches, try next refname
-			new_ref = refname + '___%d' % i
-			i += 1
+			suffix = i
+			new_ref = refname + '___%d' % suffix
 		else:
 			print('WARNING: Unable to find a non-conflicting name for "%s",\n'
 				  '\tTry to adjust the map configuration' % refname,
@@ -2780,6 +3001,7 @@ class project_history_tree(history_reader):
 
 		self.all_refs.set(new_ref, new_ref)
 		self.all_refs.set_used_by(new_ref, new_ref, path, match_full_path=True)
+		self.refname_next_suffix[refname] = suffix + 1
 		return new_ref
 
 	def update_ref(self, ref, sha1, path, log_file=None):
@@ -3371,7 +3593,10 @@ class project_history_tree(history_reader):
 				for line in fd:
 					obj_sha1, _, git_sha1 = line.strip().partition(' ')
 					if obj_sha1 and git_sha1:
-						self.prev_sha1_map[obj_sha1] = git_sha1
+						try:
+							self.prev_sha1_map[bytes.fromhex(obj_sha1)] = git_sha1
+						except ValueError:
+							pass
 		except FileNotFoundError as fnf:
 			pass
 		return
@@ -3380,7 +3605,7 @@ class project_history_tree(history_reader):
 
 		with open(filename, 'wt', encoding='utf-8') as fd:
 			for obj_sha1, git_sha1 in sorted(self.sha1_map.items()):
-				print(obj_sha1, git_sha1, file=fd)
+				print(obj_sha1.hex(), git_sha1, file=fd)
 		return
 
 	def print_unmapped_directories(self, fd):
@@ -3405,6 +3630,10 @@ class project_history_tree(history_reader):
 		return
 
 	def map_author(self, author):
+		if not author:
+			# git commit-tree barfs if author is not provided
+			return self.no_author_info
+
 		author_info = self.authors_map.get(author, None)
 		if author_info is not None:
 			return author_info